@@ -1,9 +1,39 @@
 import struct
 import csv
 import os
-
-BLOCK_FACTOR = 3
-MAX_INDEX_ENTRIES = 5
+import sys
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+
+from buffer_pool import BufferPool
+from metrics import Metrics, measured, histogram
+from ingest import ingest, batches, threaded_batches, DEFAULT_BATCH_SIZE
+from wal import WriteAheadLog, MISSING
+from external_sort import external_sort, DEFAULT_RUN_SIZE
+from product_dictionary import ProductDictionary
+
+PAGE_SIZE = 4096 # tamaño de pagina por defecto (bytes); el block factor de cada archivo sale de aca
+EMPTY_MIN_KEY = 2**31 - 1 # min/max de la cabecera de una pagina vacia (min > max)
+EMPTY_MAX_KEY = -2**31
+READ_AHEAD_PAGES = 16 # paginas contiguas que range_search lee de una vez
+REORGANIZE_CHAIN_LENGTH = 3.0 # paginas por entrada del indice a partir de las que add() reorganiza
+REORGANIZE_SUFFIX = '.reorg' # copias (shadow) que arma reorganize()
+REORGANIZE_READY_SUFFIX = '.reorg.ready' # copia de datos completa, lista para reemplazar
+INDEX_PAGE_SIZE = 4096 # tamaño de una pagina del indice (bytes); de aca sale el fanout
+INDEX_FILL_FACTOR = 0.8 # ocupacion de las hojas del indice al construirlo
+DEMO_INDEX_FANOUT = 5 # indice chico para que el demo muestre divisiones y encadenamiento
+RECORD_V1 = 1 # formato original de los registros (Record.FORMAT)
+RECORD_V2 = 2 # formato compacto (CompactRecordCodec), con diccionario de productos
+DICTIONARY_SUFFIX = '.dict' # diccionario de productos de un archivo con registros v2
+DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d') # fechas que el formato compacto guarda como numero de dia
+# bits altos del numero de dia (el dia ordinal ocupa menos de 22 bits) que dicen como
+# escribir la fecha: en el orden de '%Y-%m-%d' y/o con el dia o el mes sin el cero adelante
+DATE_ISO = 1 << 28
+DATE_SHORT_DAY = 1 << 29
+DATE_SHORT_MONTH = 1 << 30
+DATE_FLAGS = DATE_ISO | DATE_SHORT_DAY | DATE_SHORT_MONTH
 
 class Record:
     FORMAT = 'i30s5sff10s'
@@ -14,7 +44,7 @@ class Record:
         self.nombre_producto = nombre_producto[:29]
         self.cantidad = cantidad
         self.precio = precio
-        self.fecha = fecha[:9]
+        self.fecha = fecha[:10]
     
     def pack(self):
         cantidad_str = str(self.cantidad).encode('utf-8')[:4]
@@ -35,214 +65,670 @@ class Record:
             unpacked[1].decode('utf-8').rstrip('\x00'),
             int(unpacked[3]),
             unpacked[4],
-            unpacked[5].decode('utf-8').rstrip('\x00')
+            unpacked[5].decode('utf-8').rstrip('\x00').rstrip()
         )
 
     def __str__(self):
         return f"ID: {self.id_venta} - {self.nombre_producto} - Cant: {self.cantidad}, ${self.precio}"
 
+@lru_cache(maxsize=4096)
+def date_to_day(fecha: str) -> int:
+    # numero de dia (date.toordinal) de una fecha en DATE_FORMATS, con los bits de DATE_FLAGS
+    # que la devuelven igual; 0 si esta vacia o no se reconoce
+    for date_format in DATE_FORMATS:
+        try:
+            day = datetime.strptime(fecha.strip(), date_format).toordinal()
+        except ValueError:
+            continue
+        for flags in range(0, DATE_FLAGS + 1, DATE_ISO):
+            if day_to_date(day | flags) == fecha:
+                return day | flags
+        return day
+    return 0
+
+@lru_cache(maxsize=4096)
+def day_to_date(day: int) -> str:
+    # sin bits de DATE_FLAGS, con el formato del CSV (el primero de DATE_FORMATS)
+    if day <= 0:
+        return ""
+    fecha = date.fromordinal(day & ~DATE_FLAGS)
+    day_text = str(fecha.day) if day & DATE_SHORT_DAY else f'{fecha.day:02d}'
+    month_text = str(fecha.month) if day & DATE_SHORT_MONTH else f'{fecha.month:02d}'
+    if day & DATE_ISO:
+        return f'{fecha.strftime("%Y")}-{month_text}-{day_text}'
+    return f'{day_text}/{month_text}/{fecha.strftime("%Y")}'
+
+class RecordCodec:
+    # formato v1: el de Record.pack/unpack
+    VERSION = RECORD_V1
+    SIZE = Record.SIZE_OF_RECORD
+
+    def pack(self, record):
+        return record.pack()
+
+    def unpack(self, data):
+        return Record.unpack(data)
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+class CompactRecordCodec(RecordCodec):
+    # formato v2: cantidad una sola vez y como entero, la fecha como numero de dia y el
+    # producto como codigo de un diccionario guardado aparte. la clave sigue siendo el
+    # primer campo (Page.unpack la lee sin decodificar el registro).
+    # el numero de dia lleva en sus bits altos el formato de la fecha (DATE_FLAGS). una fecha
+    # que igual no vuelve desde su numero de dia (recortada por el formato v1 anterior, en
+    # otro formato o con espacios) se guarda como texto en el mismo diccionario, con dia
+    # negativo: -1 - codigo. asi el formato no pierde ningun campo
+    VERSION = RECORD_V2
+    FORMAT = 'iifiH' # id_venta, cantidad, precio, dia de la fecha, codigo de producto
+    SIZE = struct.calcsize(FORMAT)
+
+    def __init__(self, dictionary: ProductDictionary):
+        self.dictionary = dictionary
+
+    def pack(self, record):
+        day = date_to_day(record.fecha)
+        if day_to_date(day) != record.fecha:
+            day = -1 - self.dictionary.code(record.fecha)
+        return struct.pack(self.FORMAT, record.id_venta, record.cantidad, record.precio, day,
+                           self.dictionary.code(record.nombre_producto))
+
+    def unpack(self, data):
+        id_venta, cantidad, precio, day, code = struct.unpack(self.FORMAT, data)
+        fecha = day_to_date(day) if day >= 0 else self.dictionary.name(-1 - day)
+        return Record(id_venta, self.dictionary.name(code), cantidad, precio, fecha)
+
+    def flush(self):
+        self.dictionary.flush()
+
+    def sync(self):
+        self.dictionary.sync()
+
+    def close(self):
+        self.dictionary.close()
+
+DEFAULT_CODEC = RecordCodec()
+CODECS = {RECORD_V1: RecordCodec, RECORD_V2: CompactRecordCodec}
+
+def _checked_conversion(records, codec):
+    # al cambiar de formato cada registro tiene que volver igual del formato nuevo; si no,
+    # la conversion falla antes de reemplazar el archivo
+    fields = lambda record: (record.id_venta, record.nombre_producto, record.cantidad, record.precio, record.fecha)
+    for record in records:
+        if fields(codec.unpack(codec.pack(record))) != fields(record):
+            raise ValueError(f"el registro {record.id_venta} no se puede pasar al formato v{codec.VERSION} sin perder datos")
+        yield record
+
 class Page:
-    SIZE_OF_PAGE = 200
+    # pagina con directorio de slots: los registros ocupan slots fijos en el orden en que
+    # llegaron y el directorio (ordenado por clave) dice en que slot esta cada uno, asi
+    # insertar o borrar mueve entradas de 2 bytes y no registros. la cabecera guarda la
+    # menor y la mayor clave. los registros se decodifican recien cuando se usan, con el
+    # codec (formato de registro) del archivo
+    HEADER_FORMAT = 'iiii' # n_records, next_page, min_key, max_key
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    SLOT_FORMAT = 'H'
+    SLOT_SIZE = struct.calcsize(SLOT_FORMAT)
 
     def __init__(self, records = None, next_page = -1):
-        self.records = records if records is not None else []
+        records = sorted(records, key=lambda x: x.id_venta) if records else []
+        self.slots = list(records) # Record, o los bytes del registro si todavia no se decodifico
+        self.directory = list(range(len(records)))
+        self.keys = [record.id_venta for record in records] # claves en el orden del directorio
         self.next_page = next_page
+        self.codec = DEFAULT_CODEC
 
-    def pack(self):
-        data = bytearray(self.SIZE_OF_PAGE)
-        offset = 0
+    @staticmethod
+    def size_of(block_factor, record_size = Record.SIZE_OF_RECORD):
+        return Page.HEADER_SIZE + block_factor * (Page.SLOT_SIZE + record_size)
 
-        struct.pack_into('i', data, offset, len(self.records))
-        offset += 4
+    @staticmethod
+    def block_factor_for(page_size, record_size = Record.SIZE_OF_RECORD):
+        # cuantos registros (con su entrada en el directorio) entran en page_size bytes
+        return max(1, (page_size - Page.HEADER_SIZE) // (Page.SLOT_SIZE + record_size))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def records(self):
+        # los registros en orden de clave
+        return [self._record(slot) for slot in self.directory]
+
+    def _record(self, slot):
+        record = self.slots[slot]
+        if isinstance(record, bytes):
+            record = self.slots[slot] = self.codec.unpack(record)
+        return record
+
+    def first_key(self):
+        return self.keys[0]
+
+    def max_key(self):
+        return self.keys[-1]
+
+    def record_at(self, i):
+        return self._record(self.directory[i])
+
+    def find(self, key):
+        # posicion en el directorio del registro con esa clave (busqueda binaria), o -1
+        i = bisect_left(self.keys, key)
+        return i if i < len(self.keys) and self.keys[i] == key else -1
+
+    def records_between(self, lo, hi):
+        # los registros con lo <= clave <= hi, en orden (solo se decodifican esos)
+        return [self.record_at(i) for i in range(bisect_left(self.keys, lo), bisect_right(self.keys, hi))]
+
+    def insert(self, record):
+        # el registro va al primer slot libre y su entrada al directorio, en orden
+        i = bisect_right(self.keys, record.id_venta)
+        self.directory.insert(i, len(self.slots))
+        self.keys.insert(i, record.id_venta)
+        self.slots.append(record)
+        return i
+
+    def pop(self, i):
+        # quita la entrada i del directorio; el registro del ultimo slot pasa al hueco
+        slot = self.directory.pop(i)
+        self.keys.pop(i)
+        record = self._record(slot)
+        last = len(self.slots) - 1
+        if slot != last:
+            self.slots[slot] = self.slots[last]
+            self.directory[self.directory.index(last)] = slot
+        self.slots.pop()
+        return record
+
+    def pack(self, page_size, codec = DEFAULT_CODEC):
+        data = bytearray(page_size)
+        block_factor = self.block_factor_for(page_size, codec.SIZE)
+        min_key, max_key = (self.keys[0], self.keys[-1]) if self.keys else (EMPTY_MIN_KEY, EMPTY_MAX_KEY)
+        struct.pack_into(self.HEADER_FORMAT, data, 0, len(self.keys), self.next_page, min_key, max_key)
+        struct.pack_into(f'{len(self.directory)}{self.SLOT_FORMAT}', data, self.HEADER_SIZE, *self.directory)
+        offset = self.HEADER_SIZE + block_factor * self.SLOT_SIZE
+        for record in self.slots:
+            data[offset:offset + codec.SIZE] = record if isinstance(record, bytes) else codec.pack(record)
+            offset += codec.SIZE
+        return bytes(data)
 
-        for record in self.records:
-            if offset + Record.SIZE_OF_RECORD <= self.SIZE_OF_PAGE - 4:
-                record_data = record.pack()
-                data[offset:offset + Record.SIZE_OF_RECORD] = record_data
-                offset += Record.SIZE_OF_RECORD
-        
-        struct.pack_into('i', data, self.SIZE_OF_PAGE - 4, self.next_page)
+    @staticmethod
+    def unpack(data, codec = DEFAULT_CODEC):
+        n_records, next_page, _, _ = struct.unpack_from(Page.HEADER_FORMAT, data, 0)
+        size = codec.SIZE
+        offset = Page.HEADER_SIZE + Page.block_factor_for(len(data), size) * Page.SLOT_SIZE
+        page = Page(next_page=next_page)
+        page.codec = codec
+        page.directory = list(struct.unpack_from(f'{n_records}{Page.SLOT_FORMAT}', data, Page.HEADER_SIZE))
+        page.slots = [bytes(data[offset + slot * size:offset + (slot + 1) * size]) for slot in range(n_records)]
+        # la clave es el primer campo del registro: se lee sin decodificar el resto
+        page.keys = [struct.unpack_from('i', page.slots[slot])[0] for slot in page.directory]
+        return page
+
+class DataHeader:
+    # cabecera del archivo de datos, en su primera pagina: tamaño de pagina, inicio y largo
+    # de la lista de paginas libres y version del formato de registro (0 en los archivos
+    # anteriores a la version, que usan el formato v1)
+    FORMAT = 'iiii' # page_size, free_head, n_free, record_version
+    SIZE = struct.calcsize(FORMAT)
+
+    def __init__(self, page_size, free_head = -1, n_free = 0, record_version = RECORD_V1):
+        self.page_size = page_size
+        self.free_head = free_head
+        self.n_free = n_free
+        self.record_version = record_version or RECORD_V1
 
-        return bytes(data)
+    def pack(self):
+        # ocupa una pagina entera: las paginas de datos quedan alineadas a page_size
+        return struct.pack(self.FORMAT, self.page_size, self.free_head, self.n_free,
+                           self.record_version).ljust(self.page_size, b'\x00')
 
     @staticmethod
     def unpack(data):
-        num_records = struct.unpack_from('i', data, 0)[0]
-        offset = 4
-
-        records = []
-        for _ in range(num_records):
-            if offset + Record.SIZE_OF_RECORD <= len(data) - 4:
-                record_data = data[offset:offset + Record.SIZE_OF_RECORD]
-                records.append(Record.unpack(record_data))
-                offset += Record.SIZE_OF_RECORD
-        
-        next_page = struct.unpack_from('i', data, len(data) - 4)[0]
-
-        return Page(records, next_page)
+        return DataHeader(*struct.unpack_from(DataHeader.FORMAT, data, 0))
 
    
 class DataFile:
-    def __init__(self, filename: str, indexname: str = None):
+    def __init__(self, filename: str, indexname: str = None, pool: BufferPool = None, metrics: Metrics = None,
+                 wal: WriteAheadLog = None, index_fanout: int = None,
+                 reorganize_at: float = REORGANIZE_CHAIN_LENGTH, page_size: int = PAGE_SIZE,
+                 truncate_tail: bool = False, record_version: int = RECORD_V1):
         self.filename = filename
-        self.index = IndexFile(indexname) if indexname else None
+        self.indexname = indexname
+        # contadores de E/S por operacion (opcional, compartido con el indice)
+        self.metrics = metrics
+        # las paginas se leen y escriben a traves del buffer pool (compartible con otras estructuras)
+        self.pool = pool if pool is not None else BufferPool()
+        # reorganizacion automatica cuando el largo promedio de las cadenas pasa reorganize_at
+        # (None la desactiva); si una reorganizacion anterior se corto, se completa o descarta
+        self.reorganize_at = reorganize_at
+        self._finish_reorganize()
+        # page_size y record_version solo se usan al crear el archivo; uno existente conserva
+        # los de su cabecera
+        if record_version not in CODECS:
+            raise ValueError(f"version de registro desconocida: {record_version}")
+        self._load_format(page_size, record_version)
+        # las paginas que quedan vacias y fuera de toda cadena van a una lista libre (en la
+        # cabecera) y las divisiones y encadenamientos las reutilizan antes de agrandar el
+        # archivo; con truncate_tail, las libres del final del archivo se recortan
+        self.truncate_tail = truncate_tail
+        # index_fanout solo se usa al crear el indice; uno existente conserva el suyo
+        self.index = IndexFile(indexname, metrics, self.pool, index_fanout) if indexname else None
+        self.owner = os.path.abspath(filename)
+        # modo WAL: add/delete se registran en el log y se aplican al archivo en los
+        # checkpoints (las divisiones de pagina y reescrituras del indice quedan agrupadas)
+        self.wal = wal
+        # handle persistente del archivo de datos: se abre en la primera operacion y se
+        # reutiliza hasta close(). dentro de una sesion (with DataFile(...) as data_file) las
+        # paginas modificadas quedan en el pool y se escriben al cerrar; fuera de ella se
+        # escriben al terminar cada operacion
+        self.file = None
+        self.writable = False
+        self.session = False
+        if wal and wal.memtable and os.path.exists(filename):
+            self.checkpoint()
+
+    def __enter__(self):
+        self.session = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.session = False
+        self.close()
+
+    def close(self):
+        # se puede llamar mas de una vez: el WAL solo se aplica y se cierra la primera
+        if self.wal and not self.wal.closed:
+            self.checkpoint()
+            self.wal.close()
+        self._close_handle()
+        self.codec.close()
+        if self.index:
+            self.index.close()
+
+    def flush(self):
+        # escribe en disco las paginas modificadas que siguen en el buffer pool (datos e indice);
+        # los nombres nuevos del diccionario antes que las paginas que los usan
+        self.codec.flush()
+        self.pool.flush(self.owner)
+        if self.header_dirty:
+            file = self._handle(write=True)
+            file.seek(0)
+            file.write(self.header.pack())
+            self.header_dirty = False
+        if self.file:
+            self.file.flush()
+        if self.index:
+            self.index.save_index()
 
+    def _load_format(self, page_size, record_version):
+        self.header = self._load_header() or DataHeader(page_size, record_version=record_version)
+        self.header_dirty = False
+        self.page_size = self.header.page_size
+        self.record_version = self.header.record_version
+        # con registros v2 los nombres de producto van al diccionario (DICTIONARY_SUFFIX)
+        if self.record_version == RECORD_V2:
+            self.codec = CompactRecordCodec(ProductDictionary(self.filename + DICTIONARY_SUFFIX))
+        else:
+            self.codec = RecordCodec()
+        if self.page_size < Page.size_of(1, self.codec.SIZE):
+            raise ValueError(f"el tamaño de pagina tiene que ser al menos {Page.size_of(1, self.codec.SIZE)} bytes")
+        self.block_factor = Page.block_factor_for(self.page_size, self.codec.SIZE)
+        self.data_start = self.page_size # la primera pagina del archivo es la cabecera
+
+    def _load_header(self):
+        if not os.path.exists(self.filename) or not os.path.getsize(self.filename):
+            return None
+        with open(self.filename, 'rb') as file:
+            header = DataHeader.unpack(file.read(DataHeader.SIZE))
+        filesize = os.path.getsize(self.filename)
+        if (header.record_version not in CODECS or header.page_size < Page.size_of(1, CODECS[header.record_version].SIZE)
+                or filesize % header.page_size or header.n_free < 0
+                or (header.free_head != -1 and (not header.page_size <= header.free_head < filesize
+                                                or header.free_head % header.page_size))):
+            raise ValueError(f"{self.filename}: cabecera de archivo ISAM invalida")
+        return header
+
+    def _exists(self):
+        return self.file is not None or os.path.exists(self.filename)
+
+    def _handle(self, write = False):
+        # el handle se abre en solo lectura y se reabre para escritura la primera vez que hace falta
+        if self.file is None or (write and not self.writable):
+            if self.file:
+                self.file.close()
+            self.file = open(self.filename, 'r+b' if write else 'rb')
+            self.writable = write
+        return self.file
+
+    def _close_handle(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+            self.writable = False
+
+    @measured('checkpoint')
+    def checkpoint(self):
+        # aplica las operaciones pendientes del WAL (upsert: se borra la version anterior de
+        # la clave antes de insertar) y vacia el log solo cuando el archivo ya esta en disco.
+        # sin WAL no hay nada pendiente: solo se escriben las paginas modificadas
+        if not self.wal:
+            self.flush()
+            return
+        for key, payload in self.wal.memtable.items():
+            if self._apply_search(key) is not None:
+                self._apply_delete(key)
+            if payload is not None:
+                self._apply_add(Record.unpack(payload))
+        self.flush()
+        self.codec.sync()
+        os.fsync(self._handle().fileno())
+        self.wal.reset()
+
+    @contextmanager
+    def _open(self, mode):
+        # handle persistente para una operacion; fuera de una sesion, al terminar se
+        # escriben las paginas modificadas
+        file = self._handle(write='+' in mode)
+        try:
+            yield file
+        finally:
+            if not self.session:
+                self.flush()
+
+    def _count(self, counter, n = 1):
+        if self.metrics:
+            self.metrics.count(counter, n)
+
+    def _read_page(self, file, position):
+        hit = True
+        def load():
+            nonlocal hit
+            hit = False
+            self._count('reads')
+            self._count('bytes_read', self.page_size)
+            file.seek(position)
+            data = file.read(self.page_size)
+            # despues del final (archivo sin paginas de datos todavia) hay una pagina vacia
+            return Page.unpack(data, self.codec) if data else Page()
+        page = self.pool.get(self.owner, position, load)
+        if hit:
+            self._count('pool_hits')
+        return page
+
+    def _write_page(self, file, position, page):
+        def store(pos, page):
+            # la pagina puede escribirse despues (eviccion o flush): se usa el handle vigente
+            file = self._handle(write=True)
+            file.seek(pos)
+            file.write(page.pack(self.page_size, self.codec))
+            self._count('writes')
+        self.pool.put(self.owner, position, page, store)
+
+    def _next_page(self, page):
+        # seguir el encadenamiento es un salto a una pagina de overflow
+        if page.next_page != -1:
+            self._count('overflow_hops')
+        return page.next_page
+
+    def _allocate_page(self, file, page):
+        # reutiliza una pagina de la lista libre; si no hay, la agrega al final del archivo
+        if self.header.free_head != -1:
+            position = self.header.free_head
+            self.header.free_head = self._read_page(file, position).next_page
+            self.header.n_free -= 1
+            self.header_dirty = True
+            self._write_page(file, position, page)
+            print(f" - Página libre {position} reutilizada.")
+            return position
+        return self._append_page(file, page)
+
+    def _free_page(self, file, position):
+        # una pagina libre queda vacia y enlazada (por next_page) al resto de la lista libre
+        self._write_page(file, position, Page([], self.header.free_head))
+        self.header.free_head = position
+        self.header.n_free += 1
+        self.header_dirty = True
+        print(f" - Página {position} agregada a la lista de páginas libres.")
+        if self.truncate_tail and position + self.page_size >= self._file_size(file):
+            self.truncate_free_tail()
+
+    def _file_size(self, file):
+        # las paginas agregadas se escriben directo en el archivo: su tamaño ya esta al dia
+        file.seek(0, 2)
+        return file.tell()
+
+    def _free_positions(self):
+        positions = set()
+        position = self.header.free_head
+        while position != -1:
+            positions.add(position)
+            position = self._read_page(self._handle(), position).next_page
+        return positions
+
+    def truncate_free_tail(self):
+        # recorta las paginas libres del final del archivo y rearma la lista libre en orden de
+        # posicion (se reutilizan primero las mas bajas); devuelve cuantas paginas se recortaron
+        if not self._exists():
+            return 0
+        free = sorted(self._free_positions())
+        self.flush()
+        file = self._handle(write=True)
+        end = self._file_size(file)
+        n_free = len(free)
+        while free and free[-1] == end - self.page_size:
+            end = free.pop()
+        self.header.free_head = -1
+        self.header.n_free = len(free)
+        for position in reversed(free):
+            self._write_page(file, position, Page([], self.header.free_head))
+            self.header.free_head = position
+        self.header_dirty = True
+        self.flush()
+        file.truncate(end)
+        self.pool.invalidate(self.owner)
+        if n_free > len(free):
+            print(f" - {n_free - len(free)} páginas libres recortadas del final del archivo.")
+        return n_free - len(free)
+
+    def _append_page(self, file, page):
+        # las paginas nuevas se escriben directamente al final del archivo
+        self._count('writes')
+        file.seek(0, 2)
+        position = file.tell()
+        file.write(page.pack(self.page_size, self.codec))
+        self.pool.put(self.owner, position, page, None, dirty=False)
+        return position
+
+    @measured('build_initial_file')
     def build_initial_file(self, sorted_records):
+        # sorted_records puede ser cualquier iterable (p.ej. un generador): se consume una vez
+        n_records = 0
+        self.pool.invalidate(self.owner)
+        self._close_handle()
         if os.path.exists(self.filename):
             os.remove(self.filename)
+        if self.wal:
+            # el archivo se reconstruye desde cero: lo pendiente en el log ya no aplica
+            self.wal.reset()
         
-        if self.index:
-            self.index.index = {}
-        
-        with open(self.filename, 'wb') as file:
-            current_page_records = []
-
-            for record in sorted_records:
-                current_page_records.append(record)
-
-                if len(current_page_records) == BLOCK_FACTOR:
-                    page = Page(current_page_records)
-                    page_position = file.tell()
-                    file.write(page.pack())
-
-                    if self.index:
-                        first_record_id = current_page_records[0].id_venta
-                        self.index.add(first_record_id, page_position)
-
-                    current_page_records = []
-            
-            if current_page_records:
-                page = Page(current_page_records)
+        def entries():
+            # escribe las paginas de datos y entrega (primera clave, posicion) de cada una
+            nonlocal n_records
+            for page_records in batches(sorted_records, self.block_factor):
                 page_position = file.tell()
-                file.write(page.pack())
-
-                if self.index:
-                    first_record_id = current_page_records[0].id_venta
-                    self.index.add(first_record_id, page_position)
-
-        if self.index:
-            self.index.save_index()
-        
-        print(f"Archivo inicial construido con {len(sorted_records)} registros ordenados.")
+                file.write(Page(page_records).pack(self.page_size, self.codec))
+                self._count('writes')
+                n_records += len(page_records)
+                yield page_records[0].id_venta, page_position
 
+        self.header = DataHeader(self.page_size, record_version=self.record_version)
+        self.header_dirty = False
+        with open(self.filename, 'wb') as file:
+            file.write(self.header.pack())
+            if self.index:
+                self.index.build(entries())
+            else:
+                for _ in entries():
+                    pass
+
+        print(f"Archivo inicial construido con {n_records} registros ordenados.")
+        return n_records
+
+    def load_csv(self, csv_filename: str, sorted_input: bool = False, batch_size: int = DEFAULT_BATCH_SIZE, threaded: bool = False):
+        # ingesta por streaming: si el CSV ya viene ordenado por id se construye el archivo
+        # inicial directamente desde el generador; si no, se insertan los lotes con add().
+        # sin archivo inicial no hay donde insertar: se construye desde el CSV con
+        # ordenamiento externo (build_from_csv)
+        if not sorted_input and not self._exists():
+            return self.build_from_csv(csv_filename)
+        records = iter_csv_data(csv_filename)
+        if sorted_input:
+            source = threaded_batches(records, batch_size) if threaded else batches(records, batch_size)
+            return self.build_initial_file(record for batch in source for record in batch)
+        def add_batch(batch):
+            return sum(1 for record in batch if self.add(record))
+        return ingest(records, add_batch, batch_size, threaded)
+
+    def build_from_csv(self, csv_filename: str, run_size: int = DEFAULT_RUN_SIZE, tmpdir: str = None):
+        # construye el archivo desde un CSV sin ordenar: ordenamiento externo en runs de
+        # run_size registros (en tmpdir) y la mezcla va directo a paginas e indice en una pasada
+        records = external_sort(iter_csv_data(csv_filename), lambda x: x.id_venta, Record.pack, Record.unpack,
+                                Record.SIZE_OF_RECORD, run_size, directory=tmpdir)
+        return self.build_initial_file(records)
+
+    @measured('add')
     def add(self, record: Record):
-        if not os.path.exists(self.filename):
+        # devuelve True si el registro se inserto (o quedo en el log)
+        if not self._exists():
             print("Error: Debe construir el archivo inicial primero con build_initial_file().")
-            return
+            return False
         
-        with open(self.filename, 'r+b') as file:
+        # el buffer pool guarda el registro tal como queda en disco (y no el objeto del llamador);
+        # el log guarda los registros en formato v1, que no depende del diccionario
+        record = self.codec.unpack(self.codec.pack(record))
+        if self.wal:
+            self.wal.put(record.id_venta, record.pack())
+            if self.wal.needs_checkpoint():
+                self.checkpoint()
+                self._maybe_reorganize()
+            return True
+        self._apply_add(record)
+        self._maybe_reorganize()
+        return True
+
+    def _apply_add(self, record):
+        with self._open('r+b') as file:
             target_position = self._find_target_position(file, record.id_venta)
 
             if self._try_insert_in_page(file, target_position, record):
                 print(" - Registro insertado en la página existente.")
                 return
             
-            if self.index and not self.index.is_full():
+            if self.index and self._can_split(file, target_position, record.id_venta):
                 print("CASO 1: División de página (hay espacio en índice)")
                 self._handle_page_split(file, target_position, record)
             
             else:
-                print("CASO 2: Encadenamiento de página (índice lleno)")
+                print("CASO 2: Encadenamiento de página (índice lleno o página ya encadenada)")
                 self._handle_page_chain(file, target_position, record)
+
+    def _can_split(self, file, position, key):
+        # solo se divide una pagina llena y sin encadenamiento (la pagina nueva se queda con
+        # la mitad superior de las claves; una cadena quedaria fuera del rango de su entrada)
+        # y si la hoja del indice donde va la nueva entrada tiene lugar
+        page = self._read_page(file, position)
+        return page.next_page == -1 and len(page) >= self.block_factor and not self.index.is_full(key)
     
     def _find_target_position(self, file, key):
         if not self.index:
             file.seek(0, 2)
             size = file.tell()
-            return max(0, size - Page.SIZE_OF_PAGE) if size > 0 else 0
-        return self.index.find_page_for_key(key)
+            return max(self.data_start, size - self.page_size)
+        return self.index.find_page_for_key(key, self.data_start)
         
     def _try_insert_in_page(self, file, position, record):
         current_pos = position
         while current_pos != -1:
-            file.seek(current_pos)
-            page_data = file.read(Page.SIZE_OF_PAGE)
-            page = Page.unpack(page_data)
+            page = self._read_page(file, current_pos)
 
             should_insert_here = self._should_insert_in_this_page(page, record)
 
-            if should_insert_here and len(page.records) < BLOCK_FACTOR:
+            if should_insert_here and len(page) < self.block_factor:
                 return self._insert_record_in_page(file, current_pos, page, record)
             
             if should_insert_here:
                 return False
             
-            current_pos = page.next_page
+            current_pos = self._next_page(page)
 
         return False
     
     def _should_insert_in_this_page(self, page, record):
-        if not page.records:
-            return True
-        min_id = min(r.id_venta for r in page.records)
-        max_id = max(r.id_venta for r in page.records)
-        return min_id <= record.id_venta <= max_id or record.id_venta < min_id
+        # la pagina cubre las claves hasta su maxima (las menores que su minima tambien)
+        return not len(page) or record.id_venta <= page.max_key()
 
     def _insert_record_in_page(self, file, position, page, record):
-        old_first_id = page.records[0].id_venta if page.records else None
+        old_first_id = page.first_key() if len(page) else None
 
-        page.records.append(record)
-        page.records.sort(key=lambda x: x.id_venta)
+        page.insert(record)
         
-        file.seek(position)
-        file.write(page.pack())
-
-        new_first_id = page.records[0].id_venta
-        if self.index and old_first_id != new_first_id:
-            if old_first_id is not None and old_first_id in self.index.index:
-                del self.index.index[old_first_id]
-            self.index.add(new_first_id, position)
-            self.index.save_index()
+        self._write_page(file, position, page)
+
+        new_first_id = page.first_key()
+        if self.index:
+            self._rekey(position, old_first_id, new_first_id)
         return True
+
+    def _rekey(self, position, old_first_id, new_first_id):
+        # la primera clave de una pagina cambio: si la pagina esta en el indice se actualiza
+        # su entrada (las paginas encadenadas no tienen). la entrada se busca con la clave
+        # nueva: es la de la pagina, o la primera del indice si la clave es menor que todas
+        entry = self.index.entry_for(new_first_id) or next(self.index.items(), None)
+        if entry is None or entry[1] != position or entry[0] == new_first_id:
+            return False
+        # bajar la clave siempre es seguro; subirla solo si la entrada tenia la primera clave
+        # anterior (si no, la cadena de la pagina puede tener claves menores)
+        if new_first_id > entry[0] and entry[0] != old_first_id:
+            return False
+        return self.index.replace(entry[0], new_first_id)
     
     def _handle_page_split(self, file, position, record):
-        file.seek(position)
-        page_data = file.read(Page.SIZE_OF_PAGE)
-        page = Page.unpack(page_data)
+        page = self._read_page(file, position)
 
         all_records = page.records + [record]
         all_records.sort(key=lambda x: x.id_venta)
 
-        mid = BLOCK_FACTOR // 2 + 1
+        mid = self.block_factor // 2 + 1
         first_half = all_records[:mid]
         second_half = all_records[mid:]
 
         updated_page = Page(first_half)
-        file.seek(position)
-        file.write(updated_page.pack())
+        self._write_page(file, position, updated_page)
 
-        file.seek(0, 2)
-        new_position = file.tell()
-        new_page = Page(second_half)
-        file.write(new_page.pack())
+        new_position = self._allocate_page(file, Page(second_half))
 
         if self.index:
-            old_first_id = page.records[0].id_venta if page.records else None
-            new_first_id = updated_page.records[0].id_venta
-
-            if old_first_id and old_first_id != new_first_id:
-                if old_first_id in self.index.index:
-                    del self.index.index[old_first_id]
-                self.index.add(new_first_id, position)
-
+            old_first_id = page.first_key() if len(page) else None
+            self._rekey(position, old_first_id, updated_page.first_key())
             self.index.add(second_half[0].id_venta, new_position)
-            self.index.save_index()
 
         print(f" - Página dividida: {len(first_half)} + {len(second_half)} registros.")
         print(f" - Nuevo índice: ID {second_half[0].id_venta} -> {new_position}")
 
     def _handle_page_chain(self, file, position, record):
-        file.seek(position)
-        page_data = file.read(Page.SIZE_OF_PAGE)
-        page = Page.unpack(page_data)
-        
         current_pos = position
         previous_pos = -1
 
         while current_pos != -1:
-            file.seek(current_pos)
-            page_data = file.read(Page.SIZE_OF_PAGE)
-            page = Page.unpack(page_data)
+            page = self._read_page(file, current_pos)
 
             if self._should_insert_in_this_page(page, record):
                 all_records = page.records + [record]
@@ -252,247 +738,756 @@ class DataFile:
                 stay_records = all_records[:mid]
                 move_records = all_records[mid:]
 
-                page.records = stay_records
-                original_next = page.next_page
+                new_position = self._allocate_page(file, Page(move_records, page.next_page))
 
-                file.seek(0, 2)
-                new_position = file.tell()
-                new_page = Page(move_records, original_next)
-                file.write(new_page.pack())
-
-                page.next_page = new_position
-                file.seek(current_pos)
-                file.write(page.pack())
+                self._write_page(file, current_pos, Page(stay_records, new_position))
 
                 print(f" - Página encadenada: {len(stay_records)} + {len(move_records)} registros.")
                 print(f" - Nueva página en posición: {new_position}")
                 return
             previous_pos = current_pos
-            current_pos = page.next_page
+            current_pos = self._next_page(page)
 
-        file.seek(0, 2)
-        new_position = file.tell()
-        new_page = Page([record])
-        file.write(new_page.pack())
+        new_position = self._allocate_page(file, Page([record]))
 
         if previous_pos != -1:
-            file.seek(previous_pos)
-            page_data = file.read(Page.SIZE_OF_PAGE)
-            last_page = Page.unpack(page_data)
+            last_page = self._read_page(file, previous_pos)
             last_page.next_page = new_position
-            file.seek(previous_pos)
-            file.write(last_page.pack())
+            self._write_page(file, previous_pos, last_page)
 
         print(f" - Nueva página encadenada al final: ID {record.id_venta} en posición {new_position}.")
 
+    @measured('search')
     def search(self, key: int):
-        if not os.path.exists(self.filename):
+        if not self._exists():
             print("Error: El archivo de datos no existe.")
             return None
-        
-        with open(self.filename, 'rb') as file:
+        if self.wal:
+            payload = self.wal.lookup(key)
+            if payload is not MISSING:
+                return Record.unpack(payload) if payload is not None else None
+        return self._apply_search(key)
+
+    def _apply_search(self, key):
+        with self._open('rb') as file:
             target_position = self._find_target_position(file, key)
 
             current_pos = target_position
             while current_pos != -1:
-                file.seek(current_pos)
-                page_data = file.read(Page.SIZE_OF_PAGE)
-                page = Page.unpack(page_data)
+                page = self._read_page(file, current_pos)
 
-                for record in page.records:
-                    if record.id_venta == key:
-                        return record
+                i = page.find(key)
+                if i != -1:
+                    return page.record_at(i)
                 
-                current_pos = page.next_page
+                current_pos = self._next_page(page)
 
             return None
         
+    @measured('delete')
     def delete(self, key: int):
-        if not os.path.exists(self.filename):
+        if not self._exists():
             return False
-        with open(self.filename, 'r+b') as file:
+        if self.wal:
+            if self.search(key) is None:
+                return False
+            self.wal.delete(key)
+            if self.wal.needs_checkpoint():
+                self.checkpoint()
+            return True
+        return self._apply_delete(key)
+
+    def _apply_delete(self, key):
+        with self._open('r+b') as file:
             start_position = self._find_target_position(file, key)
 
             current_pos = start_position
             previous_pos = -1
 
             while current_pos != -1:
-                file.seek(current_pos)
-                page_data = file.read(Page.SIZE_OF_PAGE)
-                page = Page.unpack(page_data)
-
-                for i, record in enumerate(page.records):
-                    if record.id_venta == key:
-                        page.records.pop(i)
-
-                        if not page.records:
-                            print(f" - Página quedó vacía después de eliminar ID {key}.")
-                            self._handle_empty_page(file, current_pos, previous_pos, page.next_page)
-                        else:
-                            file.seek(current_pos)
-                            file.write(page.pack())
-
-                            self._update_index_after_deletion(current_pos, page.records[0].id_venta)
-                        
-                        print(f" - Registro ID {key} eliminado exitosamente.")
-                        return True
+                page = self._read_page(file, current_pos)
+
+                i = page.find(key)
+                if i != -1:
+                    page.pop(i)
+                    self._write_page(file, current_pos, page)
+
+                    if not len(page):
+                        print(f" - Página quedó vacía después de eliminar ID {key}.")
+                        self._handle_empty_page(file, key, current_pos, previous_pos, page.next_page)
+                    elif page.next_page == -1:
+                        # con paginas encadenadas la entrada conserva su clave: la cadena
+                        # puede tener claves menores que la nueva primera de esta pagina
+                        self._update_index_after_deletion(key, current_pos, page.first_key())
+                    
+                    print(f" - Registro ID {key} eliminado exitosamente.")
+                    return True
                 previous_pos = current_pos
-                current_pos = page.next_page
+                current_pos = self._next_page(page)
             print(f" - Registro ID {key} no encontrado.")
             return False
         
-    def _handle_empty_page(self, file, empty_pos, previous_pos, next_pos):
-        if self.index:
-            keys_to_remove = [k for k, v in self.index.index.items() if v == empty_pos]
-            for k in keys_to_remove:
-                del self.index.index[k]
-                print(f" - Entrada de índice para ID {k} eliminada.")
+    def _handle_empty_page(self, file, key, empty_pos, previous_pos, next_pos):
+        unlinked = False
+        if self.index and next_pos == -1:
+            # si la pagina vacia esta indexada, su entrada es la que corresponde a la clave
+            # borrada. si tiene paginas encadenadas la entrada se conserva: la pagina queda
+            # vacia como cabeza de la cadena (sin entrada, la cadena seria inalcanzable)
+            entry = self.index.entry_for(key)
+            if entry and entry[1] == empty_pos:
+                self.index.remove(entry[0])
+                print(f" - Entrada de índice para ID {entry[0]} eliminada.")
+                unlinked = True
         
         if previous_pos != -1:
-            file.seek(previous_pos)
-            prev_page_data = file.read(Page.SIZE_OF_PAGE)
-            prev_page = Page.unpack(prev_page_data)
+            prev_page = self._read_page(file, previous_pos)
             prev_page.next_page = next_pos
-            file.seek(previous_pos)
-            file.write(prev_page.pack())
+            self._write_page(file, previous_pos, prev_page)
             print(f" - Página anterior {empty_pos} ahora apunta a: {next_pos}.")
+            unlinked = True
 
-        if self.index:
-            self.index.save_index()
+        # una pagina que ya no esta en el indice ni en una cadena pasa a la lista libre. la
+        # primera pagina se conserva: recibe las claves menores que las del indice (y sin
+        # indice no se libera ninguna: la ultima pagina del archivo es la de insercion)
+        if self.index and unlinked and empty_pos != self.data_start:
+            self._free_page(file, empty_pos)
 
-    def _update_index_after_deletion(self, position, new_first_id):
+    def _update_index_after_deletion(self, key, position, new_first_id):
         if not self.index:
             return
-        old_first_id = None
-        for k, v in self.index.index.items():
-            if v == position:
-                old_first_id = k
-                break
-        
-        if old_first_id and old_first_id != new_first_id:
-            del self.index.index[old_first_id]
-            self.index.add(new_first_id, position)
-            self.index.save_index()
-            print(f" - Índice actualizado: ID {old_first_id} -> ID {new_first_id}")
+        entry = self.index.entry_for(key)
+        if entry and entry[1] == position and self._rekey(position, entry[0], new_first_id):
+            print(f" - Índice actualizado: ID {entry[0]} -> ID {new_first_id}")
 
+    @measured('scan_all_pages')
     def scan_all_pages(self):
-        if not os.path.exists(self.filename):
+        if not self._exists():
             print("Error: El archivo de datos no existe.")
             return
         
-        with open(self.filename, 'rb') as file:
-            file.seek(0, 2)
-            filesize = file.tell()
+        print("=== PÁGINAS DE DATOS ===")
+        for position, page in self.iter_pages():
+            page_num = (position - self.data_start) // self.page_size + 1
+            print(f"--- Page {page_num} (pos: {position})")
+
+            for record in page.records:
+                print(f" {record}")
             
-            print("=== PÁGINAS DE DATOS ===")
-            page_num = 1
-            position = 0
+            if page.next_page != -1:
+                print(f" -> Encadenada a posición: {page.next_page}")
 
-            while position < filesize:
-                file.seek(position)
-                page_data = file.read(Page.SIZE_OF_PAGE)
-                page = Page.unpack(page_data)
+    def page_count(self):
+        if not self._exists():
+            return 0
+        self.flush()
+        return max(0, os.path.getsize(self.filename) - self.data_start) // self.page_size
 
-                print(f"--- Page {page_num} (pos: {position})")
+    def iter_pages(self, start: int = 0, stop: int = None):
+        # generador de (posicion, pagina) en orden fisico, de la pagina start a stop (sin
+        # incluir); las paginas de la lista libre se saltan
+        if not self._exists():
+            return
+        if self.wal:
+            self.checkpoint()
+        # se lee con un handle propio (el generador puede quedar suspendido entre operaciones
+        # que mueven el persistente); page_count() ya bajo a disco las paginas pendientes
+        n_pages = self.page_count()
+        stop = n_pages if stop is None else min(stop, n_pages)
+        free = self._free_positions()
+        with open(self.filename, 'rb') as file:
+            file.seek(self.data_start + start * self.page_size)
+            for page_num in range(start, stop):
+                page_data = file.read(self.page_size)
+                self._count('reads')
+                self._count('bytes_read', len(page_data))
+                position = self.data_start + page_num * self.page_size
+                if position not in free:
+                    yield position, Page.unpack(page_data, self.codec)
+
+    def iter_records(self, start: int = 0, stop: int = None):
+        # los registros de las paginas start..stop, de a uno
+        for _, page in self.iter_pages(start, stop):
+            yield from page.records
+
+    def average_chain_length(self):
+        # paginas en uso por entrada del indice: cuanto se alargaron las cadenas de
+        # overflow (y las paginas sueltas) desde la ultima construccion
+        if not self.index or not self.index.n_entries() or not self._exists():
+            return 0.0
+        n_pages = (self._file_size(self._handle()) - self.data_start) // self.page_size - self.header.n_free
+        return n_pages / self.index.n_entries()
+
+    def _maybe_reorganize(self):
+        if self.reorganize_at is not None and self.average_chain_length() > self.reorganize_at:
+            print(f" - Cadenas largas ({self.average_chain_length():.2f} páginas por entrada): reorganizando")
+            self.reorganize()
+
+    @measured('reorganize')
+    def reorganize(self, record_version: int = None):
+        # reescribe el archivo con las paginas llenas y en orden de clave, sin cadenas, y con
+        # el indice reconstruido. se arma en archivos shadow (REORGANIZE_SUFFIX) mientras
+        # el archivo actual se sigue usando; despues se reemplazan con os.replace. los
+        # lectores con el archivo ya abierto siguen viendo la version anterior.
+        # con record_version la copia se escribe en ese formato de registro (ver convert)
+        if not self._exists():
+            return 0
+        if self.wal:
+            self.checkpoint()
+        shadow = self.filename + REORGANIZE_SUFFIX
+        index_shadow = self.indexname + REORGANIZE_SUFFIX if self.index else None
+        if self.index:
+            records = self.range_search(-2**31, 2**31 - 1)
+        else:
+            self.flush()
+            records = external_sort(self.iter_records(), lambda x: x.id_venta, Record.pack, Record.unpack,
+                                    Record.SIZE_OF_RECORD)
+        copy = DataFile(shadow, index_shadow, index_fanout=self.index.fanout if self.index else None,
+                        reorganize_at=None, page_size=self.page_size,
+                        record_version=record_version or self.record_version)
+        if copy.record_version != self.record_version:
+            records = _checked_conversion(records, copy.codec)
+        try:
+            n_records = copy.build_initial_file(records)
+        except ValueError:
+            # el archivo original queda como estaba; la copia a medio armar se descarta
+            copy.close()
+            self._finish_reorganize()
+            raise
+        copy.close()
+        for name in (shadow, index_shadow, shadow + DICTIONARY_SUFFIX):
+            if name and os.path.exists(name):
+                with open(name, 'rb') as file:
+                    os.fsync(file.fileno())
+        # punto de no retorno: con la copia de datos marcada como lista, una reorganizacion
+        # cortada se completa al abrir (_finish_reorganize)
+        os.replace(shadow, self.filename + REORGANIZE_READY_SUFFIX)
+        self.pool.invalidate(self.owner)
+        self._close_handle()
+        self.codec.close()
+        if self.index:
+            self.index.close()
+            self.pool.invalidate(self.index.owner)
+        self._finish_reorganize()
+        self._load_format(self.page_size, self.record_version)
+        if self.index:
+            self.index = IndexFile(self.indexname, self.metrics, self.pool)
+        return n_records
+
+    def _finish_reorganize(self):
+        # completa el reemplazo si la copia ya estaba lista; una copia a medio armar se descarta
+        ready = self.filename + REORGANIZE_READY_SUFFIX
+        index_shadow = self.indexname + REORGANIZE_SUFFIX if self.indexname else None
+        dictionary_shadow = self.filename + REORGANIZE_SUFFIX + DICTIONARY_SUFFIX
+        if os.path.exists(ready):
+            if index_shadow and os.path.exists(index_shadow):
+                os.replace(index_shadow, self.indexname)
+            if os.path.exists(dictionary_shadow):
+                os.replace(dictionary_shadow, self.filename + DICTIONARY_SUFFIX)
+            os.replace(ready, self.filename)
+        for name in (self.filename + REORGANIZE_SUFFIX, index_shadow, dictionary_shadow):
+            if name and os.path.exists(name):
+                os.remove(name)
+
+    def range_search(self, lo: int, hi: int):
+        # generador de los registros con lo <= id_venta <= hi en orden de clave. las paginas
+        # primarias se recorren en el orden del indice desde la de lo (cada una con su
+        # cadena de overflow) y se corta en la primera entrada mayor que hi. como con
+        # iter_pages, no conviene modificar el archivo mientras el generador esta abierto
+        if not self._exists() or lo > hi:
+            return
+        if self.wal:
+            self.checkpoint()
+        if not self.index:
+            # sin indice no hay orden entre paginas: se recorre todo el archivo
+            yield from sorted((record for record in self.iter_records() if lo <= record.id_venta <= hi),
+                              key=lambda x: x.id_venta)
+            return
+        self.flush()
+        file = self._handle()
+        for position, page in self._read_ahead(file, self._range_heads(lo, hi)):
+            records = page.records_between(lo, hi)
+            current_pos = self._next_page(page)
+            while current_pos != -1:
+                page = self._read_page(file, current_pos)
+                records.extend(page.records_between(lo, hi))
+                current_pos = self._next_page(page)
+            records.sort(key=lambda x: x.id_venta)
+            yield from records
+
+    def _range_heads(self, lo, hi):
+        # posiciones de las paginas primarias que pueden tener claves en [lo, hi], en orden.
+        # las claves menores que la primera entrada del indice van a la primera pagina
+        if self.index.entry_for(lo) is None:
+            first = next(self.index.items(), None)
+            if first is None or first[1] != self.data_start:
+                yield self.data_start
+        for key, position in self.index.items(lo):
+            if key > hi:
+                return
+            yield position
+
+    def _read_ahead(self, file, positions):
+        # agrupa las paginas contiguas en el archivo (hasta READ_AHEAD_PAGES) y lee cada
+        # grupo con una sola lectura; las paginas leidas asi no pasan por el buffer pool
+        chunk = []
+        for position in positions:
+            if chunk and (position != chunk[-1] + self.page_size or len(chunk) == READ_AHEAD_PAGES):
+                yield from self._read_chunk(file, chunk)
+                chunk = []
+            chunk.append(position)
+        if chunk:
+            yield from self._read_chunk(file, chunk)
+
+    def _read_chunk(self, file, chunk):
+        file.seek(chunk[0])
+        data = file.read(len(chunk) * self.page_size)
+        self._count('reads', len(chunk))
+        self._count('bytes_read', len(data))
+        for i, position in enumerate(chunk[:len(data) // self.page_size]):
+            yield position, Page.unpack(data[i * self.page_size:(i + 1) * self.page_size], self.codec)
+
+    @measured('stats')
+    def stats(self):
+        # forma del archivo: ocupacion de las paginas, largo de los encadenamientos (desde
+        # cada pagina primaria), proporcion de overflow y uso del indice
+        pages = dict(self.iter_pages())
+        overflow = {page.next_page for page in pages.values() if page.next_page != -1}
+        chain_lengths = []
+        for position in pages:
+            if position in overflow:
+                continue
+            length = 0
+            while position != -1:
+                length += 1
+                position = pages[position].next_page
+            chain_lengths.append(length)
+        return {
+            'records': sum(len(page) for page in pages.values()),
+            'pages': len(pages),
+            'overflow_pages': len(overflow),
+            'chain_length': histogram(chain_lengths),
+            'page_fill': histogram(len(page) for page in pages.values()),
+            'overflow_ratio': len(overflow) / len(pages) if pages else 0.0,
+            'free_pages': self.header.n_free,
+            'record_version': self.record_version,
+            'record_size': self.codec.SIZE,
+            'page_size': self.page_size,
+            'block_factor': self.block_factor,
+            'index_utilization': self.index.utilization() if self.index else None,
+            'index_height': self.index.header.height if self.index else None,
+            'operations': self.metrics.to_dict() if self.metrics else None,
+        }
+
+class IndexPage:
+    # pagina del indice: entradas (clave, posicion) ordenadas por clave. en las hojas la
+    # posicion es la de una pagina de datos; en los niveles de arriba es la de una pagina
+    # del nivel inferior y la clave es la menor de ese subarbol
+    HEADER_FORMAT = 'i' # n_entries
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    ENTRY_FORMAT = 'ii' # clave, posicion
+    ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+
+    def __init__(self, keys = None, positions = None):
+        self.keys = keys if keys is not None else []
+        self.positions = positions if positions is not None else []
 
-                for record in page.records:
-                    print(f" {record}")
-                
-                if page.next_page != -1:
-                    print(f" -> Encadenada a posición: {page.next_page}")
-                
-                position += Page.SIZE_OF_PAGE
-                page_num += 1
+    @staticmethod
+    def size_of(fanout):
+        return IndexPage.HEADER_SIZE + fanout * IndexPage.ENTRY_SIZE
+
+    @staticmethod
+    def fanout_for(page_size):
+        return max(2, (page_size - IndexPage.HEADER_SIZE) // IndexPage.ENTRY_SIZE)
+
+    def pack(self, fanout):
+        data = bytearray(self.size_of(fanout))
+        struct.pack_into(self.HEADER_FORMAT, data, 0, len(self.keys))
+        offset = self.HEADER_SIZE
+        for key, position in zip(self.keys, self.positions):
+            struct.pack_into(self.ENTRY_FORMAT, data, offset, key, position)
+            offset += self.ENTRY_SIZE
+        return bytes(data)
+
+    @staticmethod
+    def unpack(data):
+        n_entries = struct.unpack_from(IndexPage.HEADER_FORMAT, data, 0)[0]
+        keys = []
+        positions = []
+        for key, position in struct.iter_unpack(IndexPage.ENTRY_FORMAT, data[IndexPage.HEADER_SIZE:IndexPage.HEADER_SIZE + n_entries * IndexPage.ENTRY_SIZE]):
+            keys.append(key)
+            positions.append(position)
+        return IndexPage(keys, positions)
+
+class IndexHeader:
+    # cabecera del archivo de indice: fanout, posicion de la raiz, cantidad de niveles y
+    # de entradas en las hojas (root = -1 y height = 0 si el indice esta vacio)
+    FORMAT = 'iiii'
+    SIZE = struct.calcsize(FORMAT)
+
+    def __init__(self, fanout, root = -1, height = 0, n_entries = 0):
+        self.fanout = fanout
+        self.root = root
+        self.height = height
+        self.n_entries = n_entries
+
+    def pack(self):
+        return struct.pack(self.FORMAT, self.fanout, self.root, self.height, self.n_entries)
+
+    @staticmethod
+    def unpack(data):
+        return IndexHeader(*struct.unpack(IndexHeader.FORMAT, data))
 
 class IndexFile:
-    def __init__(self, indexname: str):
+    # indice ISAM de varios niveles en disco, construido de abajo hacia arriba por
+    # build_initial_file. una busqueda baja desde la raiz con busqueda binaria en cada
+    # pagina: height lecturas de pagina (log_fanout de las paginas de datos). las hojas
+    # se llenan hasta INDEX_FILL_FACTOR y el resto queda para las divisiones; las paginas
+    # del indice nunca se dividen: con la hoja llena, DataFile encadena
+    def __init__(self, indexname: str, metrics: Metrics = None, pool: BufferPool = None, fanout: int = None):
         self.indexname = indexname
-        self.index = {}
-        self.load_index()
+        self.metrics = metrics
+        self.pool = pool if pool is not None else BufferPool()
+        self.owner = os.path.abspath(indexname)
+        self.file = None
+        # las modificaciones quedan en las paginas del pool y en la cabecera en memoria;
+        # save_index (flush/close/checkpoint de DataFile) escribe solo lo modificado
+        self.dirty = False
+        self.header = self._load_header()
+        if self.header is None:
+            fanout = fanout or IndexPage.fanout_for(INDEX_PAGE_SIZE)
+            if fanout < 2:
+                raise ValueError("el fanout del indice tiene que ser al menos 2")
+            self.header = IndexHeader(fanout)
+        self.fanout = self.header.fanout
+        self.page_size = IndexPage.size_of(self.fanout)
+
+    def _load_header(self):
+        # cabecera de un indice existente, o None si no existe o no es valida (se empieza vacio)
+        if not os.path.exists(self.indexname):
+            return None
+        filesize = os.path.getsize(self.indexname)
+        if filesize < IndexHeader.SIZE:
+            return None
+        with open(self.indexname, 'rb') as file:
+            header = IndexHeader.unpack(file.read(IndexHeader.SIZE))
+        page_size = IndexPage.size_of(header.fanout) if header.fanout >= 2 else 0
+        if header.fanout < 2 or header.height < 0 or header.n_entries < 0:
+            return None
+        if header.root != -1 and (header.root < IndexHeader.SIZE or header.root + page_size > filesize
+                                  or (header.root - IndexHeader.SIZE) % page_size):
+            return None
+        if (header.root == -1) != (header.height == 0):
+            return None
+        return header
+
+    def _handle(self):
+        if self.file is None:
+            if os.path.exists(self.indexname) and self.header.root != -1:
+                self.file = open(self.indexname, 'r+b')
+            else:
+                # indice nuevo (o vacio): se empieza el archivo con la cabecera
+                self.pool.invalidate(self.owner)
+                self.file = open(self.indexname, 'w+b')
+                self.file.write(self.header.pack())
+        return self.file
+
+    def close(self):
+        if self.file:
+            self.save_index()
+            self.file.close()
+            self.file = None
+
+    def _count(self, counter, n = 1):
+        if self.metrics:
+            self.metrics.count(counter, n)
+
+    def _read(self, position):
+        hit = True
+        def load():
+            nonlocal hit
+            hit = False
+            self._count('reads')
+            self._count('bytes_read', self.page_size)
+            file = self._handle()
+            file.seek(position)
+            return IndexPage.unpack(file.read(self.page_size))
+        page = self.pool.get(self.owner, position, load)
+        if hit:
+            self._count('pool_hits')
+        return page
+
+    def _write(self, position, page):
+        def store(pos, page):
+            file = self._handle()
+            file.seek(pos)
+            file.write(page.pack(self.fanout))
+            self._count('writes')
+        self.pool.put(self.owner, position, page, store)
+
+    def _append(self, file, page):
+        self._count('writes')
+        file.seek(0, 2)
+        position = file.tell()
+        file.write(page.pack(self.fanout))
+        self.pool.put(self.owner, position, page, None, dirty=False)
+        return position
+
+    def build(self, entries):
+        # entries: (clave, posicion) de las paginas de datos, ordenadas por clave (puede ser
+        # un generador). primero se escriben las hojas y despues cada nivel superior con la
+        # primera clave de cada pagina del nivel de abajo, hasta que queda una sola (la raiz)
+        self.pool.invalidate(self.owner)
+        if self.file:
+            self.file.close()
+        self.file = open(self.indexname, 'w+b')
+        self.header = IndexHeader(self.fanout)
+        self.file.write(self.header.pack())
+        n_entries = 0
+        def counted(entries):
+            nonlocal n_entries
+            for entry in entries:
+                n_entries += 1
+                yield entry
+        level = self._write_level(counted(entries), max(1, int(self.fanout * INDEX_FILL_FACTOR)))
+        height = 1 if level else 0
+        while len(level) > 1:
+            level = self._write_level(level, self.fanout)
+            height += 1
+        self.header = IndexHeader(self.fanout, level[0][1] if level else -1, height, n_entries)
+        self.dirty = True
+        self.save_index()
+
+    def _write_level(self, entries, per_page):
+        # escribe las entradas de a per_page por pagina; devuelve (primera clave, posicion)
+        # de cada pagina escrita, que son las entradas del nivel de arriba
+        level = []
+        for batch in batches(entries, per_page):
+            page = IndexPage([key for key, _ in batch], [position for _, position in batch])
+            level.append((page.keys[0], self._append(self.file, page)))
+        return level
+
+    def _path(self, key):
+        # camino [(posicion, pagina, i)] desde la raiz hasta la hoja: en cada pagina i es la
+        # ultima entrada con clave <= key (en los niveles de arriba, al menos la primera;
+        # en la hoja -1 si todas las claves son mayores)
+        path = []
+        position = self.header.root
+        for depth in range(self.header.height):
+            page = self._read(position)
+            i = bisect_right(page.keys, key) - 1
+            leaf = depth == self.header.height - 1
+            if not leaf:
+                i = max(i, 0)
+            path.append((position, page, i))
+            if not leaf:
+                position = page.positions[i]
+        return path
+
+    def _fix_path(self, path):
+        # despues de modificar la hoja del camino: se escribe y, subiendo, una pagina que
+        # quedo vacia se quita de su padre y una que cambio su primera clave la actualiza en el padre
+        self.dirty = True
+        depth = len(path) - 1
+        while depth > 0:
+            position, page, _ = path[depth]
+            _, parent, j = path[depth - 1]
+            self._write(position, page)
+            if not page.keys:
+                del parent.keys[j]
+                del parent.positions[j]
+            elif parent.keys[j] != page.keys[0]:
+                parent.keys[j] = page.keys[0]
+            else:
+                return
+            depth -= 1
+        position, page, _ = path[0]
+        self._write(position, page)
+        if not page.keys:
+            self.header.root = -1
+            self.header.height = 0
+
+    def entry_for(self, key: int):
+        # (clave, posicion) de la ultima entrada con clave <= key, o None
+        if self.header.root == -1:
+            return None
+        _, page, i = self._path(key)[-1]
+        if i < 0:
+            return None
+        return page.keys[i], page.positions[i]
+
+    def find_page_for_key(self, key: int, default: int = 0):
+        # posicion de la pagina de datos para key; default si es menor que todas las claves
+        entry = self.entry_for(key)
+        return entry[1] if entry else default
+
+    def is_full(self, key: int):
+        # la hoja donde iria key no tiene lugar para otra entrada
+        if self.header.root == -1:
+            return False
+        _, page, _ = self._path(key)[-1]
+        return len(page.keys) >= self.fanout
 
     def add(self, key: int, position: int):
-        self.index[key] = position
-    
-    def is_full(self):
-        return len(self.index) >= MAX_INDEX_ENTRIES
-    
-    def find_page_for_key(self, key: int):
-        if not self.index:
-            return 0
-        
-        sorted_keys = sorted(self.index.keys())
+        if self.header.root == -1:
+            self.header.root = self._append(self._handle(), IndexPage([key], [position]))
+            self.header.height = 1
+            self.header.n_entries = 1
+            self.dirty = True
+            return
+        path = self._path(key)
+        _, page, i = path[-1]
+        if i >= 0 and page.keys[i] == key:
+            page.positions[i] = position
+        else:
+            if len(page.keys) >= self.fanout:
+                raise ValueError(f"la hoja del indice para la clave {key} esta llena")
+            page.keys.insert(i + 1, key)
+            page.positions.insert(i + 1, position)
+            self.header.n_entries += 1
+        self._fix_path(path)
+
+    def remove(self, key: int):
+        if self.header.root == -1:
+            return False
+        path = self._path(key)
+        _, page, i = path[-1]
+        if i < 0 or page.keys[i] != key:
+            return False
+        del page.keys[i]
+        del page.positions[i]
+        self.header.n_entries -= 1
+        self._fix_path(path)
+        return True
 
-        best_position = 0
-        for index_key in sorted_keys:
-            if index_key <= key:
-                best_position = self.index[index_key]
-            else:
-                break
-        return best_position
-    
-    def save_index(self):
-        with open(self.indexname, 'wb') as file:
-            file.write(struct.pack('i', len(self.index)))
-            for key in sorted(self.index.keys()):
-                file.write(struct.pack('ii', key, self.index[key]))
-    
-    def load_index(self):
-        if not os.path.exists(self.indexname):
-            return 
-        with open(self.indexname, 'rb') as file:
-            try:
-                num_entries = struct.unpack('i', file.read(4))[0]
+    def replace(self, old_key: int, new_key: int):
+        # cambia la clave de una entrada sin moverla: new_key tiene que quedar entre las
+        # claves de las entradas vecinas (es la nueva primera clave de la misma pagina de datos)
+        if self.header.root == -1:
+            return False
+        path = self._path(old_key)
+        _, page, i = path[-1]
+        if i < 0 or page.keys[i] != old_key:
+            return False
+        page.keys[i] = new_key
+        self._fix_path(path)
+        return True
 
-                for _ in range(num_entries):
-                    key, position = struct.unpack('ii', file.read(8))
-                    self.index[key] = position
-            except:
-                self.index = {}
+    def items(self, start: int = None):
+        # entradas de las hojas en orden de clave; con start, desde la ultima entrada con
+        # clave <= start (o desde la primera si no hay ninguna)
+        def walk(position, depth, bounded):
+            page = self._read(position)
+            i = max(0, bisect_right(page.keys, start) - 1) if bounded else 0
+            if depth == self.header.height - 1:
+                yield from zip(page.keys[i:], page.positions[i:])
+                return
+            for j in range(i, len(page.positions)):
+                yield from walk(page.positions[j], depth + 1, bounded and j == i)
+        if self.header.root != -1:
+            yield from walk(self.header.root, 0, start is not None)
+
+    def n_leaves(self):
+        def walk(position, depth):
+            if depth == self.header.height - 1:
+                return 1
+            return sum(walk(child, depth + 1) for child in self._read(position).positions)
+        return walk(self.header.root, 0) if self.header.root != -1 else 0
+
+    def capacity(self):
+        # entradas que entran en las hojas actuales
+        return self.n_leaves() * self.fanout
+
+    def utilization(self):
+        capacity = self.capacity()
+        return self.header.n_entries / capacity if capacity else 0.0
+
+    def save_index(self):
+        # baja a disco las paginas modificadas desde el ultimo save_index y la cabecera
+        if not self.dirty:
+            return
+        self._count('index_rewrites')
+        file = self._handle()
+        self.pool.flush(self.owner)
+        file.seek(0)
+        file.write(self.header.pack())
+        file.flush()
+        self.dirty = False
 
     def show_index(self):
-        print("=== ÍNDICE DISPERSO ===")
-        for key in sorted(self.index.keys()):
-            print(f"ID Venta: {key} -> Posición: {self.index[key]}")
+        print(f"=== ÍNDICE ISAM ({self.header.height} niveles, fanout {self.fanout}) ===")
+        for key, position in self.items():
+            print(f"ID Venta: {key} -> Posición: {position}")
         print("=======================")
 
-def load_csv_data(filename):
-    records = []
-
-    try:
-        with open(filename, 'r', encoding='utf-8-sig') as file:
-            sample = file.read(1024)
-            file.seek(0)
-
-            delimiter = ',' if ',' in sample else ';'
-            reader = csv.reader(file, delimiter=delimiter)
-            headers = next(reader)
+    def n_entries(self):
+        return self.header.n_entries
+
+def convert(filename: str, indexname: str = None, record_version: int = RECORD_V2):
+    # pasa un archivo existente (y su indice) a otro formato de registro; es una
+    # reorganizacion, asi que tambien deja las paginas llenas y sin cadenas
+    with DataFile(filename, indexname) as data_file:
+        previous = data_file.record_version
+        n_records = data_file.reorganize(record_version)
+        print(f"{filename}: {n_records} registros convertidos de v{previous} a v{data_file.record_version} "
+              f"({data_file.block_factor} registros por página de {data_file.page_size} bytes)")
+    return n_records
+
+def iter_csv_data(filename, show_headers = False):
+    # generador: una fila valida del CSV a la vez (las invalidas se saltan)
+    with open(filename, 'r', encoding='utf-8-sig') as file:
+        sample = file.read(1024)
+        file.seek(0)
+
+        delimiter = ',' if ',' in sample else ';'
+        reader = csv.reader(file, delimiter=delimiter)
+        headers = next(reader)
+        if show_headers:
             print(f"Columnas del CSV: {headers}")
 
-            for row in reader:
-                if len(row) >= 4:
-                    try:
-                        id_venta = int(row[0])
-                        nombre = row[1]
-                        cantidad = int(row[2])
-                        precio = float(row[3])
-                        fecha = row[4] if len(row) > 4 else ""
-                        record = Record(id_venta, nombre, cantidad, precio, fecha)
-                        records.append(record)
-                    except ValueError:
-                        continue
+        for row in reader:
+            if len(row) >= 4:
+                try:
+                    id_venta = int(row[0])
+                    nombre = row[1]
+                    cantidad = int(row[2])
+                    precio = float(row[3])
+                    fecha = row[4] if len(row) > 4 else ""
+                except ValueError:
+                    continue
+                yield Record(id_venta, nombre, cantidad, precio, fecha)
+
+def load_csv_data(filename):
+    try:
+        records = list(iter_csv_data(filename, show_headers=True))
         print(f"Cargados {len(records)} registros desde el CSV.")
         return records
     except FileNotFoundError:
         print(f"Error: El archivo {filename} no fue encontrado.")
         return []
     
+DEMO_PAGE_SIZE = Page.size_of(3) # paginas de 3 registros: el demo muestra divisiones y encadenamiento
+
 if __name__ == "__main__":
+    if len(sys.argv) in (5, 6) and sys.argv[1] == 'build':
+        # uso: python ISAM1.py build <archivo.csv> <datos.dat> <indice.dat> [registros por run]
+        run_size = int(sys.argv[5]) if len(sys.argv) == 6 else DEFAULT_RUN_SIZE
+        with DataFile(sys.argv[3], sys.argv[4]) as data_file:
+            data_file.build_from_csv(sys.argv[2], run_size)
+        sys.exit()
+    if len(sys.argv) in (3, 4) and sys.argv[1] == 'convert':
+        # uso: python ISAM1.py convert <datos.dat> [indice.dat]  (al formato compacto v2)
+        convert(sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None)
+        sys.exit()
+
     print("=== LABORATORIO 3: ISAM (Sparse Index) ===")
-    print(f"BLOCK_FACTOR: {BLOCK_FACTOR}")
-    print(f"MAX_INDEX_ENTRIES: {MAX_INDEX_ENTRIES}")
     
     print("\n1. Creando DataFile con índice...")
-    data_file = DataFile("ventas.dat", "indice_ventas.dat")
+    for name in ("ventas.dat", "indice_ventas.dat", "ventas.dat" + DICTIONARY_SUFFIX):
+        if os.path.exists(name):
+            os.remove(name)
+    data_file = DataFile("ventas.dat", "indice_ventas.dat", index_fanout=DEMO_INDEX_FANOUT, page_size=DEMO_PAGE_SIZE)
+    print(f"BLOCK_FACTOR: {data_file.block_factor} (páginas de {data_file.page_size} bytes)")
+    print(f"Fanout del índice: {data_file.index.fanout}")
     
     print("\n2. Cargando registros desde CSV...")
     records = load_csv_data("sales_dataset_unsorted.csv")
@@ -516,7 +1511,7 @@ if __name__ == "__main__":
     
     print("\n")
     data_file.index.show_index()
-    print(f"Entradas en índice: {len(data_file.index.index)}/{MAX_INDEX_ENTRIES}")
+    print(f"Entradas en índice: {data_file.index.n_entries()}/{data_file.index.capacity()}")
     
     print("\n6. Agregando registros para demostrar DIVISIÓN (índice no lleno)...")
     division_records = [
@@ -533,7 +1528,7 @@ if __name__ == "__main__":
     
     print("\n")
     data_file.index.show_index()
-    print(f"Entradas en índice: {len(data_file.index.index)}/{MAX_INDEX_ENTRIES}")
+    print(f"Entradas en índice: {data_file.index.n_entries()}/{data_file.index.capacity()}")
     
     print("\n8. Agregando registros para demostrar ENCADENAMIENTO (índice lleno)...")
     chain_records = [
@@ -550,7 +1545,7 @@ if __name__ == "__main__":
     
     print("\n")
     data_file.index.show_index()
-    print(f"Entradas en índice: {len(data_file.index.index)}/{MAX_INDEX_ENTRIES}")
+    print(f"Entradas en índice: {data_file.index.n_entries()}/{data_file.index.capacity()}")
     
     print("\n10. Pruebas de búsqueda:")
     search_ids = [25, 33, 450, 750, 999, 99999]
@@ -560,6 +1555,10 @@ if __name__ == "__main__":
             print(f"✓ Encontrado: {result}")
         else:
             print(f"✗ No encontrado: ID {search_id}")
+
+    print("\nBúsqueda por rango [100, 500]:")
+    for record in data_file.range_search(100, 500):
+        print(f" {record}")
     
     print("\n11. Pruebas de eliminación:")
     print("Eliminando registros para demostrar diferentes casos...")
@@ -583,5 +1582,22 @@ if __name__ == "__main__":
     
     print("\n")
     data_file.index.show_index()
+    print(f"Páginas libres: {data_file.header.n_free}")
+
+    print("\n13. Reutilizando páginas libres...")
+    data_file.add(Record(1500, "Producto E", 5, 500.0, "2023-01-05"))
+    print(f"Páginas libres: {data_file.header.n_free}")
+    data_file.delete(1500)
+    print(f"Páginas recortadas del final: {data_file.truncate_free_tail()}, libres: {data_file.header.n_free}")
+
+    print("\n14. Convirtiendo al formato compacto de registros (v2)...")
+    print(f"Registro v1: {data_file.codec.SIZE} bytes, {data_file.block_factor} registros por página")
+    data_file.reorganize(RECORD_V2)
+    print(f"Registro v2: {data_file.codec.SIZE} bytes, {data_file.block_factor} registros por página, "
+          f"{len(data_file.codec.dictionary)} entradas en el diccionario (productos y fechas en otro formato)")
+    data_file.scan_all_pages()
+    print(f"Búsqueda después de convertir: {data_file.search(25)}")
+
+    data_file.close()
 
     print("\n=== FIN DEL LABORATORIO ===")
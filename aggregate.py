@@ -0,0 +1,92 @@
+# consultas de agregacion en paralelo sobre los archivos de static_hashing e ISAM1
+
+# el rango de buckets principales (hash) o de paginas (ISAM) se divide entre los procesos
+# de un ProcessPoolExecutor; cada uno abre el archivo en solo lectura, recorre su parte con
+# iter_records() y devuelve un resultado parcial {grupo: total} que despues se suma.
+# los archivos tienen que estar bajados a disco (flush) antes de consultar
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import static_hashing
+import ISAM1
+
+# nombres de los campos en cada formato de registro
+FIELDS = {
+    'hash': {'producto': 'nombre_producto', 'fecha': 'fecha_venta',
+             'cantidad': 'cantidad_vendida', 'precio': 'precio_unitario'},
+    'isam': {'producto': 'nombre_producto', 'fecha': 'fecha',
+             'cantidad': 'cantidad', 'precio': 'precio'},
+}
+
+def _n_units(kind, filename):
+    # cantidad de unidades que se reparten: cadenas (hash) o paginas (ISAM)
+    if kind == 'hash':
+        return static_hashing.N_MAIN_BUCKETS
+    with ISAM1.DataFile(filename) as data_file:
+        return data_file.page_count()
+
+def _records(kind, filename, start, stop):
+    if kind == 'hash':
+        with open(filename, 'rb') as file:
+            yield from static_hashing.StaticHashing(file).iter_records(start, stop)
+    else:
+        with ISAM1.DataFile(filename) as data_file:
+            yield from data_file.iter_records(start, stop)
+
+def _partial(kind, filename, start, stop, group_field, value_fields):
+    totals = {}
+    for record in _records(kind, filename, start, stop):
+        value = 1.0
+        for field in value_fields:
+            value *= getattr(record, field)
+        key = getattr(record, group_field)
+        totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+def _ranges(n, parts):
+    # divide range(n) en (a lo sumo) parts rangos contiguos de tamaño parecido
+    parts = max(1, min(parts, n))
+    return [(i * n // parts, (i + 1) * n // parts) for i in range(parts)]
+
+def aggregate(filename, kind = 'hash', group_by = 'producto', value = ('cantidad', 'precio'), workers = None):
+    # suma de value (producto de los campos) agrupada por group_by; kind es 'hash' o 'isam'.
+    # group_by y value usan los nombres de FIELDS o directamente los atributos del Record
+    fields = FIELDS[kind]
+    group_field = fields.get(group_by, group_by)
+    value_fields = tuple(fields.get(name, name) for name in value)
+    workers = workers or os.cpu_count() or 1
+    ranges = _ranges(_n_units(kind, filename), workers)
+    if workers == 1 or len(ranges) == 1:
+        partials = [_partial(kind, filename, start, stop, group_field, value_fields) for start, stop in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(_partial, kind, filename, start, stop, group_field, value_fields)
+                       for start, stop in ranges]
+            partials = [future.result() for future in futures]
+    totals = {}
+    for partial in partials:
+        for key, total in partial.items():
+            totals[key] = totals.get(key, 0.0) + total
+    return totals
+
+def revenue_by_product(filename, kind = 'hash', workers = None):
+    # ingreso total (cantidad * precio) por producto
+    return aggregate(filename, kind, 'producto', ('cantidad', 'precio'), workers)
+
+def revenue_by_date(filename, kind = 'hash', workers = None):
+    return aggregate(filename, kind, 'fecha', ('cantidad', 'precio'), workers)
+
+
+if __name__ == "__main__":
+    # uso: python aggregate.py <archivo.dat> [hash|isam] [producto|fecha]
+    if len(sys.argv) < 2:
+        print("uso: python aggregate.py <archivo.dat> [hash|isam] [producto|fecha]")
+        sys.exit(1)
+    filename = sys.argv[1]
+    kind = sys.argv[2] if len(sys.argv) > 2 else 'hash'
+    group_by = sys.argv[3] if len(sys.argv) > 3 else 'producto'
+    totals = aggregate(filename, kind, group_by)
+    print(f"=== Ingresos por {group_by} ({kind}) ===")
+    for key, total in sorted(totals.items(), key=lambda item: -item[1]):
+        print(f"{key}: {total:.2f}")
@@ -0,0 +1,142 @@
+# filtros de Bloom por cadena de buckets
+
+# un filtro de Bloom con contadores (counting Bloom filter) por bucket principal permite
+# descartar una clave inexistente sin leer la cadena, y soporta borrados.
+# cada cadena tiene su propio tamaño, segun cuantas claves tiene: cuando las claves pasan
+# el doble de las previstas el dueño de los datos lo rearma mas grande (resize) con las
+# claves de la cadena, asi la tasa de falsos positivos no crece con el archivo.
+# los contadores se guardan en un archivo aparte (sidecar) junto al archivo de datos, con
+# la generacion del archivo de datos con la que quedaron al dia
+import math
+import os
+import struct
+import threading
+
+BLOOM_MIN_SLOTS = 64     # contadores de una cadena vacia (siempre potencia de 2)
+BLOOM_SLOTS_PER_KEY = 16 # contadores por clave al dimensionar (~0.24% de falsos positivos con 4 hashes)
+BLOOM_HASHES = 4         # funciones hash por clave
+MASK64 = (1 << 64) - 1
+
+def _mix(key):
+    # mezcla la clave (las claves de una cadena comparten key % N_MAIN_BUCKETS)
+    x = key & MASK64
+    x = ((x ^ (x >> 33)) * 0xff51afd7ed558ccd) & MASK64
+    x = ((x ^ (x >> 33)) * 0xc4ceb9fe1a85ec53) & MASK64
+    return x ^ (x >> 33)
+
+def slots_for(n_keys):
+    # potencia de 2 con BLOOM_SLOTS_PER_KEY contadores por clave (al menos BLOOM_MIN_SLOTS)
+    slots = BLOOM_MIN_SLOTS
+    while slots < n_keys * BLOOM_SLOTS_PER_KEY:
+        slots *= 2
+    return slots
+
+class ChainFilters:
+    MAGIC = b'BLM2' # el formato anterior tenia un tamaño fijo para todas las cadenas
+    HEADER_FORMAT = '4siii' # magic, n_chains, hashes, generation
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    def __init__(self, filename: str, n_chains: int, generation: int = 0, hashes: int = BLOOM_HASHES):
+        self.filename = filename
+        self.n_chains = n_chains
+        self.hashes = hashes
+        self.generation = generation
+        # un arreglo de contadores por cadena: en modo concurrente cada uno se modifica (o se
+        # reemplaza en un resize) solo con el latch de su cadena
+        self.slots = [BLOOM_MIN_SLOTS] * n_chains
+        self.counters = [bytearray(BLOOM_MIN_SLOTS) for _ in range(n_chains)]
+        self.n_keys = [0] * n_chains
+        self.dirty = False
+        self.loaded = self._load()
+        # estadisticas de consultas negativas; en modo concurrente las actualizan hilos con
+        # latches de cadenas distintas, por eso van con un lock
+        self.stats_lock = threading.Lock()
+        self.negatives = 0       # claves que no existian
+        self.skipped = 0         # negativas descartadas por el filtro (sin leer buckets)
+        self.false_positives = 0 # negativas que el filtro dejo pasar
+    def _positions(self, chain, key):
+        x = _mix(key)
+        h1 = x & 0xffffffff
+        h2 = (x >> 32) | 1
+        slots = self.slots[chain]
+        return [(h1 + i * h2) % slots for i in range(self.hashes)]
+    def add(self, chain, key):
+        counters = self.counters[chain]
+        for pos in self._positions(chain, key):
+            if counters[pos] < 255:
+                counters[pos] += 1
+        self.n_keys[chain] += 1
+        self.dirty = True
+    def remove(self, chain, key):
+        counters = self.counters[chain]
+        for pos in self._positions(chain, key):
+            # un contador saturado ya no se puede decrementar sin riesgo de falsos negativos
+            if 0 < counters[pos] < 255:
+                counters[pos] -= 1
+        self.n_keys[chain] -= 1
+        self.dirty = True
+    def might_contain(self, chain, key):
+        counters = self.counters[chain]
+        for pos in self._positions(chain, key):
+            if not counters[pos]:
+                return False
+        return True
+    def needs_resize(self, chain):
+        # True si la cadena tiene mas del doble de las claves para las que se dimensiono
+        return self.n_keys[chain] * BLOOM_SLOTS_PER_KEY > 2 * self.slots[chain]
+    def resize(self, chain, keys):
+        # rearma el filtro de la cadena con todas sus claves, del tamaño que les corresponde
+        keys = list(keys)
+        self.slots[chain] = slots_for(len(keys))
+        self.counters[chain] = bytearray(self.slots[chain])
+        self.n_keys[chain] = 0
+        self.dirty = True
+        for key in keys:
+            self.add(chain, key)
+    def record_negative(self, skipped):
+        with self.stats_lock:
+            self.negatives += 1
+            if skipped:
+                self.skipped += 1
+            else:
+                self.false_positives += 1
+    def estimated_fp_rate(self):
+        # promedio por cadena de (1 - e^(-k n / m))^k
+        rates = [(1 - math.exp(-self.hashes * n / m)) ** self.hashes for n, m in zip(self.n_keys, self.slots)]
+        return sum(rates) / len(rates)
+    def stats(self):
+        with self.stats_lock:
+            negatives, skipped, false_positives = self.negatives, self.skipped, self.false_positives
+        return {
+            'estimated_fp_rate': self.estimated_fp_rate(),
+            'observed_fp_rate': false_positives / negatives if negatives else 0.0,
+            'negatives': negatives,
+            'skipped': skipped,
+            'false_positives': false_positives,
+        }
+    def save(self, generation: int):
+        # se reescribe tambien si solo cambio la generacion (p.ej. un compact que no
+        # agrega ni borra claves), para que al reabrir el sidecar siga siendo valido
+        if not self.dirty and generation == self.generation:
+            return
+        with open(self.filename, 'wb') as file:
+            file.write(struct.pack(self.HEADER_FORMAT, self.MAGIC, self.n_chains, self.hashes, generation))
+            file.write(struct.pack(f'{self.n_chains}i', *self.n_keys))
+            file.write(struct.pack(f'{self.n_chains}i', *self.slots))
+            for counters in self.counters:
+                file.write(counters)
+        self.generation = generation
+        self.dirty = False
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return False
+        with open(self.filename, 'rb') as file:
+            header = file.read(self.HEADER_SIZE)
+            if len(header) < self.HEADER_SIZE or struct.unpack(self.HEADER_FORMAT, header) != (self.MAGIC, self.n_chains, self.hashes, self.generation):
+                return False
+            n_keys = list(struct.unpack(f'{self.n_chains}i', file.read(4 * self.n_chains)))
+            slots = list(struct.unpack(f'{self.n_chains}i', file.read(4 * self.n_chains)))
+            counters = [bytearray(file.read(m)) for m in slots]
+            if any(len(data) != m for data, m in zip(counters, slots)) or file.read(1):
+                return False
+            self.n_keys, self.slots, self.counters = n_keys, slots, counters
+        return True
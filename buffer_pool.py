@@ -0,0 +1,79 @@
+# buffer pool compartido para los bloques (Bucket / Page) de las estructuras de archivo
+import threading
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 64 # numero de bloques en memoria
+
+class BufferPool:
+    # cache LRU de bloques ya decodificados con escritura diferida (write-back).
+    # las claves son (owner, pos): owner identifica el archivo, pos la posicion del bloque.
+    # cada frame guarda [bloque, dirty, store] donde store(pos, bloque) lo escribe a disco.
+    # las operaciones sobre los frames estan protegidas por un lock; las lecturas de disco
+    # de un fallo se hacen fuera de el para no serializar la E/S de distintos hilos
+    def __init__(self, capacity = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.lock = threading.RLock()
+        self.frames = OrderedDict()
+        self.dirty = set() # claves de los frames modificados
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, owner, pos, load):
+        # devuelve el bloque en pos; si no esta en memoria lo lee con load()
+        key = (owner, pos)
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return frame[0]
+            self.misses += 1
+        block = load()
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                # otro hilo lo cargo (o lo escribio) mientras tanto
+                self.frames.move_to_end(key)
+                return frame[0]
+            self._insert(key, [block, False, None])
+        return block
+
+    def put(self, owner, pos, block, store, dirty = True):
+        # registra el bloque en pos; si dirty, se escribira con store en flush/eviccion
+        key = (owner, pos)
+        with self.lock:
+            frame = self.frames.get(key)
+            if dirty:
+                self.dirty.add(key)
+            if frame is None:
+                self._insert(key, [block, dirty, store])
+                return
+            frame[0] = block
+            if dirty:
+                frame[1] = True
+                frame[2] = store
+            self.frames.move_to_end(key)
+
+    def _insert(self, key, frame):
+        self.frames[key] = frame
+        while len(self.frames) > self.capacity:
+            (owner, pos), (block, dirty, store) = self.frames.popitem(last=False)
+            if dirty:
+                self.dirty.discard((owner, pos))
+                store(pos, block)
+
+    def flush(self, owner = None):
+        # escribe los bloques modificados (de un archivo o de todos) y los deja limpios
+        with self.lock:
+            for key in [key for key in self.dirty if owner is None or key[0] == owner]:
+                frame = self.frames[key]
+                frame[2](key[1], frame[0])
+                frame[1] = False
+                self.dirty.discard(key)
+
+    def invalidate(self, owner):
+        # descarta sin escribir todos los bloques de un archivo (p.ej. si se reconstruye)
+        with self.lock:
+            for key in [key for key in self.frames if key[0] == owner]:
+                del self.frames[key]
+                self.dirty.discard(key)
@@ -0,0 +1,235 @@
+# extendible hashing implementation
+
+# mismo formato de registro que static_hashing; en lugar de encadenar overflow
+# se divide el bucket lleno y se duplica el directorio cuando hace falta
+import struct
+import os
+
+from buffer_pool import BufferPool
+from static_hashing import Record, import_csv
+
+MAX_GLOBAL_DEPTH = 16 # a partir de aqui ya no se divide y se encadena overflow
+BLOCK_FACTOR = 4 # registros por bucket
+
+class Bucket:
+    HEADER_FORMAT = 'iii' # size, local_depth, next_bucket
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    SIZE_OF_BUCKET = HEADER_SIZE + BLOCK_FACTOR * Record.SIZE_OF_RECORD
+    def __init__(self, records = None, local_depth = 1, next_bucket = -1):
+        self.records = records if records is not None else []
+        self.local_depth = local_depth
+        self.next_bucket = next_bucket
+    def pack(self):
+        header_data = struct.pack(self.HEADER_FORMAT, len(self.records), self.local_depth, self.next_bucket)
+        record_data = b''.join(record.pack() for record in self.records)
+        return header_data + record_data + b'\x00' * ((BLOCK_FACTOR - len(self.records)) * Record.SIZE_OF_RECORD)
+    @staticmethod
+    def unpack(data : bytes):
+        size, local_depth, next_bucket = struct.unpack(Bucket.HEADER_FORMAT, data[:Bucket.HEADER_SIZE])
+        offset = Bucket.HEADER_SIZE
+        records = []
+        for i in range(size):
+            records.append(Record.unpack(data[offset: offset + Record.SIZE_OF_RECORD]))
+            offset += Record.SIZE_OF_RECORD
+        return Bucket(records, local_depth, next_bucket)
+
+class ExtendibleHashing:
+    # el directorio (global_depth + punteros a buckets) vive en memoria y se guarda
+    # en un archivo aparte; una busqueda lee un solo bucket salvo en MAX_GLOBAL_DEPTH
+    def __init__(self, file, directory_filename: str = None, pool: BufferPool = None):
+        self.file = file
+        self.directory_filename = directory_filename or file.name + '.dir'
+        self.pool = pool if pool is not None else BufferPool()
+        self.owner = os.path.abspath(file.name)
+        self.file.seek(0,2)
+        if self.file.tell() > 0:
+            # sin el directorio no se puede saber que bucket corresponde a cada clave: se
+            # falla en vez de reinicializar (y perder) un archivo con datos
+            if not os.path.exists(self.directory_filename):
+                raise ValueError(f"{file.name}: falta el directorio {self.directory_filename}")
+            self._load_directory()
+        else:
+            # archivo nuevo: dos buckets de profundidad local 1; el directorio se escribe
+            # enseguida para que el archivo nunca quede con datos y sin directorio
+            self.pool.invalidate(self.owner)
+            self.global_depth = 1
+            self.directory = [self._append_bucket(Bucket()), self._append_bucket(Bucket())]
+            self.file.flush()
+            self._save_directory()
+    def hash(self, key):
+        return key & ((1 << self.global_depth) - 1)
+    def _read_bucket(self, pos):
+        return self.pool.get(self.owner, pos, lambda: self._read_raw(pos))
+    def _write_bucket(self, pos, bucket):
+        self.pool.put(self.owner, pos, bucket, self._write_raw)
+    def _read_raw(self, pos):
+        self.file.seek(pos)
+        return Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
+    def _write_raw(self, pos, bucket):
+        self.file.seek(pos)
+        self.file.write(bucket.pack())
+    def _append_bucket(self, bucket):
+        self.file.seek(0,2)
+        pos = self.file.tell()
+        self.file.write(bucket.pack())
+        self.pool.put(self.owner, pos, bucket, self._write_raw, dirty=False)
+        return pos
+    def _load_directory(self):
+        with open(self.directory_filename, 'rb') as file:
+            self.global_depth = struct.unpack('i', file.read(4))[0]
+            n = 1 << self.global_depth
+            self.directory = list(struct.unpack(f'{n}i', file.read(4 * n)))
+        self.directory_dirty = False
+    def _save_directory(self):
+        with open(self.directory_filename, 'wb') as file:
+            file.write(struct.pack('i', self.global_depth))
+            file.write(struct.pack(f'{len(self.directory)}i', *self.directory))
+        self.directory_dirty = False
+    def flush(self):
+        self.pool.flush(self.owner)
+        self.file.flush()
+        if self.directory_dirty:
+            self._save_directory()
+    def close(self):
+        # baja buckets y directorio; el archivo lo cierra quien lo abrio
+        self.flush()
+    def add(self, record: Record):
+        record = Record.unpack(record.pack())
+        while True:
+            bucket_index = self.hash(record.id_venta)
+            pos = self.directory[bucket_index]
+            bucket = self._read_bucket(pos)
+            if len(bucket.records) < BLOCK_FACTOR:
+                bucket.records.append(record)
+                self._write_bucket(pos, bucket)
+                return
+            if bucket.local_depth >= MAX_GLOBAL_DEPTH:
+                self._add_overflow(pos, bucket, record)
+                return
+            self._split(bucket_index, pos, bucket)
+    def _split(self, bucket_index, pos, bucket):
+        local_depth = bucket.local_depth
+        if local_depth == self.global_depth:
+            # duplicar el directorio: la mitad nueva apunta a los mismos buckets
+            self.directory = self.directory + self.directory
+            self.global_depth += 1
+        # repartir los registros segun el bit local_depth del hash
+        stay = [r for r in bucket.records if not (r.id_venta >> local_depth) & 1]
+        move = [r for r in bucket.records if (r.id_venta >> local_depth) & 1]
+        bucket.records = stay
+        bucket.local_depth = local_depth + 1
+        self._write_bucket(pos, bucket)
+        new_pos = self._append_bucket(Bucket(move, local_depth + 1))
+        # actualizar las entradas del directorio que apuntaban al bucket y tienen el bit en 1
+        start = bucket_index & ((1 << local_depth) - 1)
+        for i in range(start, len(self.directory), 1 << local_depth):
+            if (i >> local_depth) & 1:
+                self.directory[i] = new_pos
+        self.directory_dirty = True
+    def _add_overflow(self, pos, bucket, record):
+        # solo ocurre en MAX_GLOBAL_DEPTH: se encadena como en static hashing
+        while bucket.next_bucket != -1:
+            pos = bucket.next_bucket
+            bucket = self._read_bucket(pos)
+            if len(bucket.records) < BLOCK_FACTOR:
+                bucket.records.append(record)
+                self._write_bucket(pos, bucket)
+                return
+        bucket.next_bucket = self._append_bucket(Bucket([record], bucket.local_depth))
+        self._write_bucket(pos, bucket)
+    def search(self, id_venta):
+        pos = self.directory[self.hash(id_venta)]
+        while pos != -1:
+            bucket = self._read_bucket(pos)
+            for record in bucket.records:
+                if record.id_venta == id_venta:
+                    return record
+            pos = bucket.next_bucket
+        return None
+    def delete(self, id_venta):
+        # no se fusionan buckets: el directorio nunca se reduce
+        pos = self.directory[self.hash(id_venta)]
+        while pos != -1:
+            bucket = self._read_bucket(pos)
+            for i, record in enumerate(bucket.records):
+                if record.id_venta == id_venta:
+                    del bucket.records[i]
+                    self._write_bucket(pos, bucket)
+                    return True
+            pos = bucket.next_bucket
+        return False
+    def scanAll(self):
+        seen = set()
+        for i, pos in enumerate(self.directory):
+            if pos in seen:
+                continue
+            seen.add(pos)
+            bucket = self._read_bucket(pos)
+            print(f"--- Bucket {i:0{self.global_depth}b} (pos: {pos}, profundidad local: {bucket.local_depth}) ---")
+            for record in bucket.records:
+                print(record)
+            overflow_idx = 1
+            next_pos = bucket.next_bucket
+            while next_pos != -1:
+                overflow_bucket = self._read_bucket(next_pos)
+                print(f"    --- Overflow {overflow_idx} ---")
+                for record in overflow_bucket.records:
+                    print("    ", record)
+                next_pos = overflow_bucket.next_bucket
+                overflow_idx += 1
+    def show_directory(self):
+        print(f"=== DIRECTORIO (profundidad global: {self.global_depth}) ===")
+        for i, pos in enumerate(self.directory):
+            print(f"{i:0{self.global_depth}b} -> {pos}")
+
+
+if __name__ == "__main__":
+    print("=== LABORATORIO 3: Extendible Hashing ===")
+    print(f"BLOCK_FACTOR: {BLOCK_FACTOR}")
+    print(f"MAX_GLOBAL_DEPTH: {MAX_GLOBAL_DEPTH}")
+
+    filename = 'dataextendible.dat'
+    csv_filename = 'sales_dataset_unsorted.csv'
+
+    for name in (filename, filename + '.dir'):
+        if os.path.exists(name):
+            os.remove(name)
+
+    with open(filename, 'w+b') as file:
+        extendible_hashing = ExtendibleHashing(file)
+
+        print("\n1. Cargando registros desde CSV...")
+        records = import_csv(csv_filename)
+        test_records = records[:20]
+
+        print("\n2. Insertando registros (los buckets llenos se dividen)...")
+        for record in test_records:
+            extendible_hashing.add(record)
+        print(f" - Insertados {len(test_records)} registros.")
+
+        print("\n3. Contenido de los buckets:")
+        extendible_hashing.scanAll()
+        print()
+        extendible_hashing.show_directory()
+
+        print("\n4. Pruebas de búsqueda:")
+        for search_id in [test_records[0].id_venta, test_records[-1].id_venta, 99999]:
+            result = extendible_hashing.search(search_id)
+            if result:
+                print(f"✓ Encontrado: {result}")
+            else:
+                print(f"✗ No encontrado: ID {search_id}")
+
+        print("\n5. Pruebas de eliminación:")
+        del_id = test_records[0].id_venta
+        print(f"Eliminando ID {del_id}: {extendible_hashing.delete(del_id)}")
+        print(f"Buscando ID {del_id}: {extendible_hashing.search(del_id)}")
+
+        print("\n6. Carga completa del CSV...")
+        for record in records[20:]:
+            extendible_hashing.add(record)
+        extendible_hashing.close()
+        print(f" - Profundidad global: {extendible_hashing.global_depth}, "
+              f"buckets: {len(set(extendible_hashing.directory))}")
+
+        print("\n=== FIN DEL LABORATORIO ===")
@@ -0,0 +1,60 @@
+# ordenamiento externo (merge sort) para entradas que no entran en memoria
+
+# la entrada se consume de a run_size registros: cada run se ordena en memoria y se
+# escribe a un archivo temporal con el formato fijo del registro. despues los runs se
+# mezclan con un heap (heapq.merge, un registro por run en memoria) y el resultado se
+# entrega como generador, listo para build_initial_file. si hay mas de MERGE_FAN_IN runs
+# se hacen pasadas intermedias que los juntan en runs mas largos
+import heapq
+import tempfile
+
+from ingest import batches
+
+DEFAULT_RUN_SIZE = 100000 # registros ordenados en memoria por run
+MERGE_FAN_IN = 64 # runs (archivos abiertos) que se mezclan a la vez
+
+def _write_run(records, pack, directory):
+    file = tempfile.TemporaryFile(dir=directory)
+    for record in records:
+        file.write(pack(record))
+    file.seek(0)
+    return file
+
+def _read_run(file, unpack, record_size):
+    while True:
+        data = file.read(record_size)
+        if len(data) < record_size:
+            return
+        yield unpack(data)
+
+def sorted_runs(records, key, pack, run_size = DEFAULT_RUN_SIZE, directory = None):
+    # archivos temporales con runs ordenados de a lo sumo run_size registros
+    runs = []
+    for batch in batches(records, run_size):
+        batch.sort(key=key)
+        runs.append(_write_run(batch, pack, directory))
+    return runs
+
+def merge_runs(runs, key, pack, unpack, record_size, fan_in = MERGE_FAN_IN, directory = None):
+    # mezcla k-way de los runs; los archivos se cierran (y se borran) al terminar
+    try:
+        while len(runs) > fan_in:
+            # pasada intermedia: cada grupo de fan_in runs pasa a ser un run
+            merged = []
+            for i in range(0, len(runs), fan_in):
+                group = runs[i:i + fan_in]
+                merged.append(_write_run(heapq.merge(*(_read_run(run, unpack, record_size) for run in group), key=key),
+                                         pack, directory))
+                for run in group:
+                    run.close()
+            runs[:] = merged
+        yield from heapq.merge(*(_read_run(run, unpack, record_size) for run in runs), key=key)
+    finally:
+        for run in runs:
+            run.close()
+
+def external_sort(records, key, pack, unpack, record_size, run_size = DEFAULT_RUN_SIZE,
+                  fan_in = MERGE_FAN_IN, directory = None):
+    # generador con los registros de records ordenados por key, usando memoria acotada
+    runs = sorted_runs(records, key, pack, run_size, directory)
+    yield from merge_runs(runs, key, pack, unpack, record_size, fan_in, directory)
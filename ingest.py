@@ -0,0 +1,69 @@
+# ingesta por streaming de CSV
+
+# los parsers de static_hashing (iter_csv) e ISAM1 (iter_csv_data) son generadores; aca
+# se agrupan sus registros en lotes de tamaño acotado y se entregan a la insercion o a la
+# carga masiva de cada estructura, asi la memoria no depende del tamaño del CSV.
+# opcionalmente el parseo corre en un hilo aparte, solapado con las escrituras
+import threading
+from queue import Queue, Full
+
+DEFAULT_BATCH_SIZE = 1024 # registros por lote
+QUEUE_SIZE = 4 # lotes parseados que pueden esperar en la cola del hilo lector
+
+def batches(records, batch_size = DEFAULT_BATCH_SIZE):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def threaded_batches(records, batch_size = DEFAULT_BATCH_SIZE, queue_size = QUEUE_SIZE):
+    # igual que batches() pero el generador records se consume en un hilo lector;
+    # la cola acotada frena al lector si la escritura va mas lenta
+    queue = Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+    def reader():
+        try:
+            for batch in batches(records, batch_size):
+                if not put(batch):
+                    return
+            put(done)
+        except BaseException as error:
+            put((done, error))
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is done:
+                return
+            if isinstance(item, tuple) and item[0] is done:
+                # el error del parser se propaga en el hilo que escribe
+                raise item[1]
+            yield item
+    finally:
+        # si el consumidor corta antes (o falla), el lector termina en lugar de quedar bloqueado
+        stop.set()
+        thread.join()
+
+def ingest(records, insert_batch, batch_size = DEFAULT_BATCH_SIZE, threaded = False):
+    # pasa los registros a insert_batch(lote) de a lotes; devuelve cuantos se insertaron.
+    # si insert_batch devuelve un numero, es la cantidad del lote que realmente se inserto
+    total = 0
+    source = threaded_batches(records, batch_size) if threaded else batches(records, batch_size)
+    for batch in source:
+        inserted = insert_batch(batch)
+        total += len(batch) if inserted is None else inserted
+    return total
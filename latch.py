@@ -0,0 +1,53 @@
+# latch de lectores/escritor para proteger una cadena de buckets
+import threading
+from contextlib import contextmanager
+
+class RWLatch:
+    # varios lectores o un solo escritor; los escritores en espera tienen prioridad
+    # para que un flujo continuo de lecturas no los deje esperando indefinidamente
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.cond:
+            while self.writer or self.waiting_writers:
+                self.cond.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.cond:
+            self.readers -= 1
+            if not self.readers:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        with self.cond:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.cond.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.cond:
+            self.writer = False
+            self.cond.notify_all()
+
+@contextmanager
+def read_locked(latch):
+    latch.acquire_read()
+    try:
+        yield
+    finally:
+        latch.release_read()
+
+@contextmanager
+def write_locked(latch):
+    latch.acquire_write()
+    try:
+        yield
+    finally:
+        latch.release_write()
@@ -0,0 +1,287 @@
+# linear hashing implementation
+
+# variante de static_hashing donde los buckets principales crecen de a uno:
+# cuando el factor de carga supera MAX_LOAD_FACTOR se divide el bucket apuntado por
+# split y se agrega un bucket principal al final del archivo. el overflow solo es
+# temporal: al dividir un bucket sus registros se redistribuyen y se liberan los overflow
+import struct
+import os
+
+from buffer_pool import BufferPool
+from static_hashing import Record, Bucket, import_csv
+
+INITIAL_BUCKETS = 4 # numero inicial de buckets principales
+MAX_LOAD_FACTOR = 0.8 # registros / capacidad de los buckets principales
+BLOCK_FACTOR = 4 # registros por bucket
+BUCKET_SIZE = Bucket.size_of(BLOCK_FACTOR)
+
+class Header:
+    # cabecera del archivo principal: n0, level, split, n_records, free_head (overflow libres)
+    FORMAT = 'iiiii'
+    SIZE = struct.calcsize(FORMAT)
+    def __init__(self, n0 = INITIAL_BUCKETS, level = 0, split = 0, n_records = 0, free_head = -1):
+        self.n0 = n0
+        self.level = level
+        self.split = split
+        self.n_records = n_records
+        self.free_head = free_head
+    def pack(self):
+        return struct.pack(self.FORMAT, self.n0, self.level, self.split, self.n_records, self.free_head)
+    @staticmethod
+    def unpack(data: bytes):
+        return Header(*struct.unpack(Header.FORMAT, data))
+
+class LinearHashing:
+    # los buckets principales estan en el archivo de datos (despues de la cabecera) y los
+    # de overflow en un archivo aparte, asi la posicion del bucket i siempre se puede calcular
+    def __init__(self, file, overflow_filename: str = None, pool: BufferPool = None, n0: int = INITIAL_BUCKETS):
+        self.file = file
+        self.overflow_filename = overflow_filename or file.name + '.ovf'
+        self.pool = pool if pool is not None else BufferPool()
+        self.owner = os.path.abspath(file.name)
+        self.overflow_owner = os.path.abspath(self.overflow_filename)
+        self.file.seek(0,2)
+        filesize = self.file.tell()
+        if filesize > 0:
+            # un archivo con datos nunca se reinicializa: sin cabecera completa o sin el
+            # archivo de overflow se falla en vez de truncarlo
+            if filesize < Header.SIZE:
+                raise ValueError(f"{file.name}: cabecera de archivo linear hashing invalida")
+            if not os.path.exists(self.overflow_filename):
+                raise ValueError(f"{file.name}: falta el archivo de overflow {self.overflow_filename}")
+            self.file.seek(0)
+            self.header = Header.unpack(self.file.read(Header.SIZE))
+            self.overflow = open(self.overflow_filename, 'r+b')
+        else:
+            # archivo nuevo: cabecera + n0 buckets vacios
+            self.pool.invalidate(self.owner)
+            self.pool.invalidate(self.overflow_owner)
+            self.header = Header(n0)
+            self.file.seek(0)
+            self.file.write(self.header.pack())
+            for _ in range(n0):
+                self.file.write(Bucket([]).pack(BLOCK_FACTOR))
+            self.overflow = open(self.overflow_filename, 'w+b')
+        self.header_dirty = False
+    def n_buckets(self):
+        return self.header.n0 * (1 << self.header.level) + self.header.split
+    def hash(self, key):
+        n = self.header.n0 * (1 << self.header.level)
+        bucket_index = key % n
+        if bucket_index < self.header.split:
+            # el bucket ya se dividio en esta ronda: usar la funcion del siguiente nivel
+            bucket_index = key % (2 * n)
+        return bucket_index
+    def _bucket_pos(self, bucket_index):
+        return Header.SIZE + bucket_index * BUCKET_SIZE
+    def _read_main(self, pos):
+        return self.pool.get(self.owner, pos, lambda: self._read_raw(self.file, pos))
+    def _write_main(self, pos, bucket):
+        self.pool.put(self.owner, pos, bucket, self._write_main_raw)
+    def _read_overflow(self, pos):
+        return self.pool.get(self.overflow_owner, pos, lambda: self._read_raw(self.overflow, pos))
+    def _write_overflow(self, pos, bucket):
+        self.pool.put(self.overflow_owner, pos, bucket, self._write_overflow_raw)
+    def _read_raw(self, file, pos):
+        file.seek(pos)
+        return Bucket.unpack(file.read(BUCKET_SIZE))
+    def _write_main_raw(self, pos, bucket):
+        self.file.seek(pos)
+        self.file.write(bucket.pack(BLOCK_FACTOR))
+    def _write_overflow_raw(self, pos, bucket):
+        self.overflow.seek(pos)
+        self.overflow.write(bucket.pack(BLOCK_FACTOR))
+    def _allocate_overflow(self, bucket):
+        # reutiliza un overflow liberado por una division anterior; si no hay, agrega al final
+        if self.header.free_head != -1:
+            pos = self.header.free_head
+            self.header.free_head = self._read_overflow(pos).next_bucket
+            self.header_dirty = True
+            self._write_overflow(pos, bucket)
+            return pos
+        self.overflow.seek(0,2)
+        pos = self.overflow.tell()
+        self.overflow.write(bucket.pack(BLOCK_FACTOR))
+        self.pool.put(self.overflow_owner, pos, bucket, self._write_overflow_raw, dirty=False)
+        return pos
+    def _free_overflow(self, pos):
+        self._write_overflow(pos, Bucket([], self.header.free_head))
+        self.header.free_head = pos
+        self.header_dirty = True
+    def flush(self):
+        self.pool.flush(self.owner)
+        self.pool.flush(self.overflow_owner)
+        if self.header_dirty:
+            self.file.seek(0)
+            self.file.write(self.header.pack())
+            self.header_dirty = False
+        self.file.flush()
+        self.overflow.flush()
+    def close(self):
+        self.flush()
+        self.overflow.close()
+    def add(self, record: Record):
+        record = Record.unpack(record.pack())
+        pos = self._bucket_pos(self.hash(record.id_venta))
+        bucket = self._read_main(pos)
+        self.header.n_records += 1
+        self.header_dirty = True
+        if len(bucket.records) < BLOCK_FACTOR:
+            bucket.records.append(record)
+            self._write_main(pos, bucket)
+        else:
+            # overflow temporal hasta que le toque dividirse a este bucket
+            self._add_overflow(pos, bucket, record)
+        if self.header.n_records > MAX_LOAD_FACTOR * self.n_buckets() * BLOCK_FACTOR:
+            self._split()
+    def _add_overflow(self, pos, bucket, record):
+        write = self._write_main
+        while bucket.next_bucket != -1:
+            pos = bucket.next_bucket
+            bucket = self._read_overflow(pos)
+            write = self._write_overflow
+            if len(bucket.records) < BLOCK_FACTOR:
+                bucket.records.append(record)
+                write(pos, bucket)
+                return
+        bucket.next_bucket = self._allocate_overflow(Bucket([record]))
+        write(pos, bucket)
+    def _split(self):
+        # divide el bucket apuntado por split en split y split + n0 * 2^level
+        n = self.header.n0 * (1 << self.header.level)
+        old_index = self.header.split
+        old_pos = self._bucket_pos(old_index)
+        new_index = old_index + n
+        records = []
+        bucket = self._read_main(old_pos)
+        records.extend(bucket.records)
+        overflow_pos = bucket.next_bucket
+        while overflow_pos != -1:
+            overflow_bucket = self._read_overflow(overflow_pos)
+            records.extend(overflow_bucket.records)
+            self._free_overflow(overflow_pos)
+            overflow_pos = overflow_bucket.next_bucket
+        self.header.split += 1
+        if self.header.split == n:
+            self.header.level += 1
+            self.header.split = 0
+        self.header_dirty = True
+        stay = [r for r in records if r.id_venta % (2 * n) == old_index]
+        move = [r for r in records if r.id_venta % (2 * n) != old_index]
+        self._write_chain(old_pos, stay)
+        self._write_chain(self._bucket_pos(new_index), move)
+    def _write_chain(self, pos, records):
+        # escribe los registros en el bucket principal y, si no entran, en overflow nuevos
+        main = Bucket(records[:BLOCK_FACTOR])
+        previous, previous_pos, write = main, pos, self._write_main
+        for i in range(BLOCK_FACTOR, len(records), BLOCK_FACTOR):
+            bucket = Bucket(records[i:i + BLOCK_FACTOR])
+            previous.next_bucket = self._allocate_overflow(bucket)
+            write(previous_pos, previous)
+            previous, previous_pos, write = bucket, previous.next_bucket, self._write_overflow
+        write(previous_pos, previous)
+    def search(self, id_venta):
+        bucket = self._read_main(self._bucket_pos(self.hash(id_venta)))
+        while True:
+            for record in bucket.records:
+                if record.id_venta == id_venta:
+                    return record
+            if bucket.next_bucket == -1:
+                return None
+            bucket = self._read_overflow(bucket.next_bucket)
+    def delete(self, id_venta):
+        pos = self._bucket_pos(self.hash(id_venta))
+        bucket = self._read_main(pos)
+        for i, record in enumerate(bucket.records):
+            if record.id_venta == id_venta:
+                del bucket.records[i]
+                self._write_main(pos, bucket)
+                self.header.n_records -= 1
+                self.header_dirty = True
+                return True
+        prev_bucket, prev_pos, write = bucket, pos, self._write_main
+        while prev_bucket.next_bucket != -1:
+            overflow_pos = prev_bucket.next_bucket
+            bucket = self._read_overflow(overflow_pos)
+            for i, record in enumerate(bucket.records):
+                if record.id_venta == id_venta:
+                    del bucket.records[i]
+                    if bucket.records:
+                        self._write_overflow(overflow_pos, bucket)
+                    else:
+                        # overflow vacio: se desengancha de la cadena y se libera
+                        prev_bucket.next_bucket = bucket.next_bucket
+                        write(prev_pos, prev_bucket)
+                        self._free_overflow(overflow_pos)
+                    self.header.n_records -= 1
+                    self.header_dirty = True
+                    return True
+            prev_bucket, prev_pos, write = bucket, overflow_pos, self._write_overflow
+        return False
+    def scanAll(self):
+        for i in range(self.n_buckets()):
+            bucket = self._read_main(self._bucket_pos(i))
+            print(f"--- Bucket {i} (principal) ---")
+            for record in bucket.records:
+                print(record)
+            overflow_idx = 1
+            next_pos = bucket.next_bucket
+            while next_pos != -1:
+                overflow_bucket = self._read_overflow(next_pos)
+                print(f"    --- Overflow {overflow_idx} de Bucket {i} ---")
+                for record in overflow_bucket.records:
+                    print("    ", record)
+                next_pos = overflow_bucket.next_bucket
+                overflow_idx += 1
+
+
+if __name__ == "__main__":
+    print("=== LABORATORIO 3: Linear Hashing ===")
+    print(f"BLOCK_FACTOR: {BLOCK_FACTOR}")
+    print(f"INITIAL_BUCKETS: {INITIAL_BUCKETS}")
+    print(f"MAX_LOAD_FACTOR: {MAX_LOAD_FACTOR}")
+
+    filename = 'datalinear.dat'
+    csv_filename = 'sales_dataset_unsorted.csv'
+
+    for name in (filename, filename + '.ovf'):
+        if os.path.exists(name):
+            os.remove(name)
+
+    with open(filename, 'w+b') as file:
+        linear_hashing = LinearHashing(file)
+
+        print("\n1. Cargando registros desde CSV...")
+        records = import_csv(csv_filename)
+        test_records = records[:20]
+
+        print("\n2. Insertando registros (los buckets se dividen de a uno)...")
+        for record in test_records:
+            linear_hashing.add(record)
+        header = linear_hashing.header
+        print(f" - Insertados {len(test_records)} registros: {linear_hashing.n_buckets()} buckets, "
+              f"level {header.level}, split {header.split}")
+
+        print("\n3. Contenido de los buckets:")
+        linear_hashing.scanAll()
+
+        print("\n4. Pruebas de búsqueda:")
+        for search_id in [test_records[0].id_venta, test_records[-1].id_venta, 99999]:
+            result = linear_hashing.search(search_id)
+            if result:
+                print(f"✓ Encontrado: {result}")
+            else:
+                print(f"✗ No encontrado: ID {search_id}")
+
+        print("\n5. Pruebas de eliminación:")
+        del_id = test_records[0].id_venta
+        print(f"Eliminando ID {del_id}: {linear_hashing.delete(del_id)}")
+        print(f"Buscando ID {del_id}: {linear_hashing.search(del_id)}")
+
+        print("\n6. Carga completa del CSV...")
+        for record in records[20:]:
+            linear_hashing.add(record)
+        linear_hashing.close()
+        print(f" - {linear_hashing.n_buckets()} buckets principales para {linear_hashing.header.n_records} registros")
+
+        print("\n=== FIN DEL LABORATORIO ===")
@@ -0,0 +1,72 @@
+# metricas de E/S por tipo de operacion (opcionales)
+
+# StaticHashing y DataFile/IndexFile aceptan un Metrics; si no se pasa, no se cuenta nada.
+# cada operacion publica (add, search, delete, ...) acumula sus contadores por separado y
+# todo se puede exportar como dict/JSON para graficarlo en el tiempo.
+# reads/writes son paginas (o buckets) leidas y escritas en disco: se cuentan en la carga y
+# en la escritura del buffer pool, asi una escritura diferida se cuenta en la operacion que
+# la baja a disco (flush, close o la que provoca la eviccion). pool_hits son las lecturas
+# que resolvio el pool sin ir a disco
+import json
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+COUNTERS = ('calls', 'reads', 'writes', 'bytes_read', 'pool_hits', 'overflow_hops', 'index_rewrites')
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local() # pila de operaciones en curso de cada hilo
+        self.operations = {}
+    def _counters(self, name):
+        counters = self.operations.get(name)
+        if counters is None:
+            counters = self.operations[name] = dict.fromkeys(COUNTERS, 0)
+        return counters
+    @contextmanager
+    def operation(self, name):
+        # las operaciones anidadas (p.ej. compact -> flush) se cuentan en la de afuera
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        if not stack:
+            with self.lock:
+                self._counters(name)['calls'] += 1
+        stack.append(name)
+        try:
+            yield
+        finally:
+            stack.pop()
+    def count(self, counter, n = 1):
+        stack = getattr(self.local, 'stack', None)
+        name = stack[0] if stack else 'other'
+        with self.lock:
+            self._counters(name)[counter] += n
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+    def to_dict(self):
+        with self.lock:
+            return {name: dict(counters) for name, counters in self.operations.items()}
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+def measured(name):
+    # decorador para los metodos publicos: cuenta la llamada y atribuye a name la E/S que hace
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            with self.metrics.operation(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def histogram(values):
+    # {valor: cantidad}, ordenado por valor
+    result = {}
+    for value in values:
+        result[value] = result.get(value, 0) + 1
+    return dict(sorted(result.items()))
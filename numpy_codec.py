@@ -0,0 +1,120 @@
+# codec vectorizado (NumPy) para los bloques de static_hashing e ISAM1
+
+# los registros son de tamaño fijo, asi que un bucket, una pagina o una region completa
+# del archivo se puede decodificar de una vez como arreglo estructurado, y filtrar sin
+# construir un objeto Python por registro. numpy es opcional: solo lo necesita este modulo
+import operator
+import re
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import static_hashing
+import ISAM1
+
+HASH_FIELDS = ['id_venta', 'nombre_producto', 'cantidad_vendida', 'precio_unitario', 'fecha_venta']
+ISAM_FIELDS = ['id_venta', 'nombre_producto', 'cantidad_str', 'cantidad', 'precio', 'fecha']
+# formato compacto v2: fecha es el numero de dia y producto el codigo del diccionario
+# (una fecha negativa es -1 - codigo del texto de la fecha en el diccionario)
+ISAM_V2_FIELDS = ['id_venta', 'cantidad', 'precio', 'fecha', 'producto']
+
+OPERATORS = {
+    '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le,
+    '>': operator.gt, '>=': operator.ge,
+}
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy_codec necesita numpy (pip install numpy)")
+
+def record_dtype(fmt, names):
+    # dtype estructurado con los mismos desplazamientos e itemsize que el formato struct nativo
+    _require_numpy()
+    formats = []
+    for code in re.findall(r'\d*[a-zA-Z?]', fmt):
+        if code.endswith('s'):
+            formats.append('S' + code[:-1])
+        else:
+            formats.append('=' + {'i': 'i4', 'f': 'f4', 'H': 'u2'}[code])
+    return np.dtype({'names': names, 'formats': formats,
+                     'offsets': static_hashing._field_offsets(fmt), 'itemsize': struct.calcsize(fmt)})
+
+def bucket_dtype(block_factor):
+    # el factor de bloque depende del archivo (StaticHashing.block_factor)
+    Bucket = static_hashing.Bucket
+    return np.dtype({'names': ['size', 'next_bucket', 'min_key', 'max_key', 'records'],
+                     'formats': ['=i4', '=i4', '=i4', '=i4', (record_dtype(static_hashing.Record.FORMAT, HASH_FIELDS), block_factor)],
+                     'offsets': [0, 4, 8, 12, Bucket.HEADER_SIZE], 'itemsize': Bucket.size_of(block_factor)})
+
+def isam_record_dtype(codec = ISAM1.DEFAULT_CODEC):
+    if codec.VERSION == ISAM1.RECORD_V2:
+        return record_dtype(ISAM1.CompactRecordCodec.FORMAT, ISAM_V2_FIELDS)
+    return record_dtype(ISAM1.Record.FORMAT, ISAM_FIELDS)
+
+def page_dtype(page_size, codec = ISAM1.DEFAULT_CODEC):
+    # el tamaño de pagina y el formato de registro dependen del archivo (DataFile.page_size
+    # y DataFile.codec); los registros ocupan los slots 0..n_records-1 en orden de llegada
+    # y el directorio da el orden por clave
+    Page = ISAM1.Page
+    block_factor = Page.block_factor_for(page_size, codec.SIZE)
+    return np.dtype({'names': ['n_records', 'next_page', 'min_key', 'max_key', 'directory', 'records'],
+                     'formats': ['=i4', '=i4', '=i4', '=i4', ('=u2', block_factor),
+                                 (isam_record_dtype(codec), block_factor)],
+                     'offsets': [0, 4, 8, 12, Page.HEADER_SIZE, Page.HEADER_SIZE + block_factor * Page.SLOT_SIZE],
+                     'itemsize': page_size})
+
+def decode_buckets(data: bytes, block_factor: int):
+    # uno o varios buckets consecutivos -> arreglo estructurado (sin copiar los datos)
+    return np.frombuffer(data, dtype=bucket_dtype(block_factor))
+
+def encode_buckets(buckets) -> bytes:
+    return buckets.tobytes()
+
+def decode_pages(data: bytes, page_size: int, codec = ISAM1.DEFAULT_CODEC):
+    return np.frombuffer(data, dtype=page_dtype(page_size, codec))
+
+def encode_pages(pages) -> bytes:
+    return pages.tobytes()
+
+def bucket_records(buckets):
+    # solo los registros ocupados de cada bucket, como un arreglo plano
+    used = np.arange(buckets['records'].shape[1]) < buckets['size'][:, None]
+    return buckets['records'][used]
+
+def page_records(pages):
+    used = np.arange(pages['records'].shape[1]) < pages['n_records'][:, None]
+    return pages['records'][used]
+
+def read_hash_records(static_hash):
+    # todos los registros del archivo hash (principales, overflow y libres) en una sola lectura
+    static_hash.flush()
+    static_hash.file.seek(static_hashing.Header.SIZE)
+    return bucket_records(decode_buckets(static_hash.file.read(), static_hash.block_factor))
+
+def read_data_records(data_file):
+    # todas las paginas de datos (sin la cabecera) en una sola lectura
+    data_file.flush()
+    with open(data_file.filename, 'rb') as file:
+        file.seek(data_file.data_start)
+        return page_records(decode_pages(file.read(), data_file.page_size, data_file.codec))
+
+def filter_records(records, field, op, value):
+    # p.ej. filter_records(records, 'cantidad_vendida', '>', 10)
+    column = records[field]
+    if column.dtype.kind == 'S':
+        column = np.char.rstrip(column)
+        if isinstance(value, str):
+            value = value.encode()
+    return records[OPERATORS[op](column, value)]
+
+def to_hash_records(records):
+    # convierte (solo al final) las filas seleccionadas en objetos static_hashing.Record
+    return [static_hashing.Record.unpack(row.tobytes()) for row in records]
+
+def to_isam_records(records, codec = ISAM1.DEFAULT_CODEC):
+    # con registros v2, codec es el del archivo (DataFile.codec, que tiene el diccionario)
+    return [codec.unpack(row.tobytes()) for row in records]
@@ -0,0 +1,72 @@
+# diccionario de nombres de producto para el formato compacto de registros
+
+# el dataset tiene pocas decenas de productos distintos: en vez de guardar el nombre en
+# cada registro se guarda su codigo (2 bytes) y el nombre va una sola vez a este archivo.
+# el archivo es solo de agregado (largo + nombre en utf-8) y el codigo de un nombre es su
+# posicion, asi un codigo ya escrito en una pagina nunca cambia de significado.
+# el formato compacto guarda aca tambien las fechas que no puede representar como numero
+# de dia (ver CompactRecordCodec en ISAM1)
+import os
+import struct
+
+MAX_CODES = 2**16 # los codigos se guardan como 'H'
+
+class ProductDictionary:
+    LENGTH_FORMAT = 'H'
+    LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.names = []  # codigo -> nombre
+        self.codes = {}  # nombre -> codigo
+        self.file = None
+        self._load()
+    def _load(self):
+        # una entrada incompleta al final (escritura cortada por una caida) se descarta
+        if not os.path.exists(self.filename):
+            return
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+        offset = 0
+        while offset + self.LENGTH_SIZE <= len(data):
+            length = struct.unpack_from(self.LENGTH_FORMAT, data, offset)[0]
+            end = offset + self.LENGTH_SIZE + length
+            if end > len(data):
+                break
+            self._register(data[offset + self.LENGTH_SIZE:end].decode('utf-8'))
+            offset = end
+        if offset < len(data):
+            with open(self.filename, 'r+b') as file:
+                file.truncate(offset)
+    def _register(self, name):
+        code = len(self.names)
+        self.names.append(name)
+        self.codes.setdefault(name, code)
+        return code
+    def code(self, name: str) -> int:
+        # codigo del nombre; un nombre nuevo se agrega al final del archivo
+        code = self.codes.get(name)
+        if code is None:
+            if len(self.names) >= MAX_CODES:
+                raise ValueError(f"{self.filename}: el diccionario de productos esta lleno ({MAX_CODES} nombres)")
+            data = name.encode('utf-8')
+            if self.file is None:
+                self.file = open(self.filename, 'ab')
+            self.file.write(struct.pack(self.LENGTH_FORMAT, len(data)) + data)
+            code = self._register(name)
+        return code
+    def name(self, code: int) -> str:
+        return self.names[code]
+    def __len__(self):
+        return len(self.names)
+    def flush(self):
+        if self.file:
+            self.file.flush()
+    def sync(self):
+        # el diccionario tiene que llegar a disco antes que las paginas que usan sus codigos
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
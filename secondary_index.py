@@ -0,0 +1,277 @@
+# indice hash secundario sobre nombre_producto
+
+# hashing estatico (con overflow encadenado) con una entrada por producto: (nombre_producto,
+# primer bloque de su lista). la lista de cada producto son bloques encadenados de pares
+# (posicion del bucket, id_venta) del archivo hash principal, asi una busqueda recorre solo
+# los pares de ese producto y no los de todos los productos que caen en el mismo bucket.
+# StaticHashing lo mantiene al dia en add/delete/bulk_load/compact, asi "todas las ventas
+# del producto X" solo lee los buckets que tienen registros de ese producto. los pares no
+# guardan el slot: los buckets estan ordenados por id_venta y un insert corre de slot a los
+# registros de atras, pero solo un compact los cambia de bucket.
+# la cabecera guarda la generacion del archivo principal con la que el indice quedo al dia
+# y el inicio de la lista de bloques libres
+import struct
+import os
+import threading
+import zlib
+
+from buffer_pool import BufferPool
+
+ENTRY_FACTOR = 16 # productos por bucket del indice
+N_INDEX_BUCKETS = 16 # buckets principales del indice
+POSTING_FACTOR = 64 # pares (bucket_pos, id_venta) por bloque de la lista de un producto
+
+class Entry:
+    FORMAT = '30si' # nombre_producto, primer bloque de su lista
+    SIZE_OF_ENTRY = struct.calcsize(FORMAT)
+    def __init__(self, name: bytes, head: int = -1):
+        self.name = name
+        self.head = head
+    def pack(self):
+        return struct.pack(self.FORMAT, self.name, self.head)
+    @staticmethod
+    def unpack(data: bytes):
+        name, head = struct.unpack(Entry.FORMAT, data)
+        return Entry(name.rstrip(b'\x00'), head)
+
+class IndexBucket:
+    HEADER_FORMAT = 'ii' # size, next_bucket
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    SIZE_OF_BUCKET = HEADER_SIZE + ENTRY_FACTOR * Entry.SIZE_OF_ENTRY
+    def __init__(self, entries = None, next_bucket = -1):
+        self.entries = entries if entries is not None else []
+        self.next_bucket = next_bucket
+    def pack(self):
+        header_data = struct.pack(self.HEADER_FORMAT, len(self.entries), self.next_bucket)
+        entry_data = b''.join(entry.pack() for entry in self.entries)
+        return header_data + entry_data + b'\x00' * ((ENTRY_FACTOR - len(self.entries)) * Entry.SIZE_OF_ENTRY)
+    @staticmethod
+    def unpack(data: bytes):
+        size, next_bucket = struct.unpack(IndexBucket.HEADER_FORMAT, data[:IndexBucket.HEADER_SIZE])
+        offset = IndexBucket.HEADER_SIZE
+        entries = []
+        for i in range(size):
+            entries.append(Entry.unpack(data[offset: offset + Entry.SIZE_OF_ENTRY]))
+            offset += Entry.SIZE_OF_ENTRY
+        return IndexBucket(entries, next_bucket)
+
+class PostingBlock:
+    # bloque de la lista de un producto. solo el primero de la lista puede tener lugar: un
+    # par borrado se reemplaza por el ultimo del primer bloque, asi la lista no deja huecos
+    HEADER_FORMAT = 'ii' # size, next_block
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    PAIR_FORMAT = 'ii' # bucket_pos, id_venta
+    PAIR_SIZE = struct.calcsize(PAIR_FORMAT)
+    SIZE_OF_BLOCK = HEADER_SIZE + POSTING_FACTOR * PAIR_SIZE
+    def __init__(self, pairs = None, next_block = -1):
+        self.pairs = pairs if pairs is not None else []
+        self.next_block = next_block
+    def pack(self):
+        header_data = struct.pack(self.HEADER_FORMAT, len(self.pairs), self.next_block)
+        pair_data = b''.join(struct.pack(self.PAIR_FORMAT, *pair) for pair in self.pairs)
+        return header_data + pair_data + b'\x00' * ((POSTING_FACTOR - len(self.pairs)) * self.PAIR_SIZE)
+    @staticmethod
+    def unpack(data: bytes):
+        size, next_block = struct.unpack(PostingBlock.HEADER_FORMAT, data[:PostingBlock.HEADER_SIZE])
+        pairs = list(struct.iter_unpack(PostingBlock.PAIR_FORMAT,
+                                        data[PostingBlock.HEADER_SIZE: PostingBlock.HEADER_SIZE + size * PostingBlock.PAIR_SIZE]))
+        return PostingBlock(pairs, next_block)
+
+def _key(nombre_producto: str) -> bytes:
+    # mismo recorte que Record.pack del archivo principal
+    return nombre_producto[:30].ljust(30).encode()[:30].rstrip()
+
+def same_product(nombre_a: str, nombre_b: str) -> bool:
+    # True si los dos nombres van a la misma entrada del indice
+    return _key(nombre_a) == _key(nombre_b)
+
+class ProductIndex:
+    MAGIC = b'PIX3' # PIDX/PIX2: formatos anteriores, con una entrada por registro
+    HEADER_FORMAT = '4sii' # magic, generation, free_head
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    def __init__(self, filename: str, pool: BufferPool = None):
+        self.filename = filename
+        self.pool = pool if pool is not None else BufferPool()
+        self.owner = os.path.abspath(filename)
+        # el indice es uno solo para todas las cadenas: en modo concurrente lo comparten
+        # hilos que tienen latches de cadenas distintas. los buckets se leen y escriben con
+        # E/S posicional (pread/pwrite): el pool puede desalojar un bucket del indice desde
+        # un hilo que no tiene el lock y una posicion compartida del archivo se pisaria
+        self.lock = threading.RLock()
+        if os.path.exists(filename) and os.path.getsize(filename) >= self.HEADER_SIZE + N_INDEX_BUCKETS * IndexBucket.SIZE_OF_BUCKET:
+            self.file = open(filename, 'r+b')
+            self.fd = self.file.fileno()
+            magic, self.generation, self.free_head = struct.unpack(self.HEADER_FORMAT, os.pread(self.fd, self.HEADER_SIZE, 0))
+            self.header_dirty = False
+            self.end = os.fstat(self.fd).st_size
+            self.new_file = False
+            if magic != self.MAGIC:
+                # indice de un formato anterior: es derivado, se vuelve a armar
+                self.clear()
+        else:
+            self.file = open(filename, 'w+b')
+            self.fd = self.file.fileno()
+            self.clear()
+    def clear(self):
+        with self.lock:
+            self.pool.invalidate(self.owner)
+            self.file.seek(0)
+            self.file.truncate()
+            self.generation = -1
+            self.free_head = -1
+            self.header_dirty = False
+            self.file.write(self._header())
+            for _ in range(N_INDEX_BUCKETS):
+                self.file.write(IndexBucket().pack())
+            self.file.flush()
+            self.end = self.file.tell()
+            self.new_file = True
+    def _header(self):
+        return struct.pack(self.HEADER_FORMAT, self.MAGIC, self.generation, self.free_head)
+    def hash(self, key: bytes):
+        # crc32 en lugar de hash(): tiene que ser estable entre ejecuciones
+        return zlib.crc32(key) % N_INDEX_BUCKETS
+    def _read_bucket(self, pos):
+        return self.pool.get(self.owner, pos, lambda: IndexBucket.unpack(os.pread(self.fd, IndexBucket.SIZE_OF_BUCKET, pos)))
+    def _read_block(self, pos):
+        return self.pool.get(self.owner, pos, lambda: PostingBlock.unpack(os.pread(self.fd, PostingBlock.SIZE_OF_BLOCK, pos)))
+    def _write_bucket(self, pos, bucket):
+        # se empaqueta ahora, con el lock del indice tomado: si el pool desaloja el frame
+        # desde otro hilo escribe estos bytes y no el bucket, que puede estar cambiando.
+        # sirve igual para los buckets y para los bloques de las listas
+        data = bucket.pack()
+        self.pool.put(self.owner, pos, bucket, lambda pos, _: self._write_bytes(pos, data))
+    def _write_raw(self, pos, bucket):
+        self._write_bytes(pos, bucket.pack())
+    def _write_bytes(self, pos, data):
+        os.pwrite(self.fd, data, pos)
+    def _append(self, block, size):
+        # nuevo bucket o bloque al final del archivo
+        pos = self.end
+        self._write_bytes(pos, block.pack())
+        self.end += size
+        self.pool.put(self.owner, pos, block, self._write_raw, dirty=False)
+        return pos
+    def _allocate_block(self, block):
+        # reutiliza un bloque de la lista libre; si no hay, lo agrega al final del archivo
+        if self.free_head == -1:
+            return self._append(block, PostingBlock.SIZE_OF_BLOCK)
+        pos = self.free_head
+        self.free_head = self._read_block(pos).next_block
+        self.header_dirty = True
+        self._write_bucket(pos, block)
+        return pos
+    def _free_block(self, pos):
+        self._write_bucket(pos, PostingBlock([], self.free_head))
+        self.free_head = pos
+        self.header_dirty = True
+    def _chain(self, key):
+        pos = self.HEADER_SIZE + self.hash(key) * IndexBucket.SIZE_OF_BUCKET
+        while pos != -1:
+            bucket = self._read_bucket(pos)
+            yield pos, bucket
+            pos = bucket.next_bucket
+    def _find(self, key):
+        # (pos del bucket, bucket, entrada) del producto, o None si no tiene entrada
+        for pos, bucket in self._chain(key):
+            for entry in bucket.entries:
+                if entry.name == key:
+                    return pos, bucket, entry
+        return None
+    def _blocks(self, head):
+        pos = head
+        while pos != -1:
+            block = self._read_block(pos)
+            yield pos, block
+            pos = block.next_block
+    def add(self, nombre_producto: str, bucket_pos: int, id_venta: int):
+        with self.lock:
+            key = _key(nombre_producto)
+            found = self._find(key)
+            if found is None:
+                # producto nuevo: entrada en el primer bucket de la cadena con lugar
+                entry = Entry(key)
+                for pos, bucket in self._chain(key):
+                    if len(bucket.entries) < ENTRY_FACTOR:
+                        bucket.entries.append(entry)
+                        break
+                else:
+                    # cadena llena: nuevo bucket de overflow al final del archivo
+                    bucket.next_bucket = self._append(IndexBucket([entry]), IndexBucket.SIZE_OF_BUCKET)
+                found = pos, bucket, entry
+            pos, bucket, entry = found
+            if entry.head != -1:
+                head = self._read_block(entry.head)
+                if len(head.pairs) < POSTING_FACTOR:
+                    head.pairs.append((bucket_pos, id_venta))
+                    self._write_bucket(entry.head, head)
+                    return
+            # primer bloque lleno (o lista vacia): el bloque nuevo pasa a ser el primero
+            entry.head = self._allocate_block(PostingBlock([(bucket_pos, id_venta)], entry.head))
+            self._write_bucket(pos, bucket)
+    def remove(self, nombre_producto: str, bucket_pos: int, id_venta: int):
+        with self.lock:
+            key = _key(nombre_producto)
+            found = self._find(key)
+            if found is None:
+                return False
+            pos, bucket, entry = found
+            pair = (bucket_pos, id_venta)
+            for block_pos, block in self._blocks(entry.head):
+                if pair not in block.pairs:
+                    continue
+                # el hueco se llena con el ultimo par del primer bloque
+                head = self._read_block(entry.head)
+                last = head.pairs.pop()
+                if block is not head:
+                    block.pairs[block.pairs.index(pair)] = last
+                    self._write_bucket(block_pos, block)
+                elif last != pair:
+                    head.pairs[head.pairs.index(pair)] = last
+                if head.pairs:
+                    self._write_bucket(entry.head, head)
+                    return True
+                # el primer bloque quedo vacio: se libera y la lista sigue en el siguiente
+                old_head = entry.head
+                entry.head = head.next_block
+                self._free_block(old_head)
+                if entry.head == -1:
+                    bucket.entries.remove(entry)
+                self._write_bucket(pos, bucket)
+                return True
+            return False
+    def lookup(self, nombre_producto: str):
+        # lista de (bucket_pos, id_venta) de los registros con ese producto
+        with self.lock:
+            found = self._find(_key(nombre_producto))
+            if found is None:
+                return []
+            return [pair for _, block in self._blocks(found[2].head) for pair in block.pairs]
+    def utilization(self):
+        # pares ocupados / capacidad de los bloques en uso de todas las listas
+        with self.lock:
+            used = n_blocks = 0
+            for i in range(N_INDEX_BUCKETS):
+                pos = self.HEADER_SIZE + i * IndexBucket.SIZE_OF_BUCKET
+                while pos != -1:
+                    bucket = self._read_bucket(pos)
+                    for entry in bucket.entries:
+                        for _, block in self._blocks(entry.head):
+                            used += len(block.pairs)
+                            n_blocks += 1
+                    pos = bucket.next_bucket
+            return used / (n_blocks * POSTING_FACTOR) if n_blocks else 0.0
+    def flush(self, generation: int = None):
+        # con generation, el indice queda marcado como al dia con esa generacion del archivo principal
+        with self.lock:
+            self.pool.flush(self.owner)
+            if generation is not None and generation != self.generation:
+                self.generation = generation
+                self.header_dirty = True
+            if self.header_dirty:
+                self._write_bytes(0, self._header())
+                self.header_dirty = False
+            self.file.flush()
+    def close(self):
+        self.flush()
+        self.file.close()
@@ -3,10 +3,26 @@
 # estructura del bucket y la clase que gestiona el archivo de datos
 import struct
 import os
+import sys
+import json
+import re
+import mmap
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import ExitStack, nullcontext
 
-def import_csv(filename):
+from buffer_pool import BufferPool
+from bloom import ChainFilters
+from secondary_index import ProductIndex, same_product
+from latch import RWLatch, read_locked, write_locked
+from metrics import Metrics, measured, histogram
+from ingest import ingest, DEFAULT_BATCH_SIZE
+from external_sort import external_sort, DEFAULT_RUN_SIZE
+from wal import WriteAheadLog, MISSING
+
+def iter_csv(filename):
+    # generador: una fila del CSV a la vez, sin armar la lista completa en memoria
     import csv
-    records = []
     with open(filename, 'r') as file:
         reader = csv.reader(file, delimiter=';')
         next(reader) # saltar la cabecera
@@ -16,9 +32,29 @@ def import_csv(filename):
             cantidad_vendida = int(row[2])
             precio_unitario = float(row[3])
             fecha_venta = row[4]
-            record = Record(id_venta, nombre_producto, cantidad_vendida, precio_unitario, fecha_venta)
-            records.append(record)
-    return records
+            yield Record(id_venta, nombre_producto, cantidad_vendida, precio_unitario, fecha_venta)
+
+def import_csv(filename):
+    return list(iter_csv(filename))
+
+def bulk_load_csv(csv_filename, filename, batch_size = DEFAULT_BATCH_SIZE, threaded = False,
+                  run_size = DEFAULT_RUN_SIZE):
+    # carga masiva del CSV en el archivo hash (lo crea si no existe), de a lotes de
+    # batch_size registros; con threaded el CSV se parsea en otro hilo mientras se escribe.
+    # antes se agrupan los registros por cadena con un ordenamiento externo (estable: dentro
+    # de una cadena quedan en el orden del CSV), asi los lotes llenan una cadena tras otra y
+    # cada bucket se escribe una vez, salvo el ultimo de una cadena que sigue en el lote
+    # siguiente. cada cadena queda con los mismos registros en los mismos buckets que con
+    # add() de las filas en el orden del CSV; solo cambia la posicion de los buckets de
+    # overflow, que quedan contiguos por cadena en lugar de intercalados
+    mode = 'r+b' if os.path.exists(filename) else 'w+b'
+    with open(filename, mode) as file:
+        static_hashing = StaticHashing(file)
+        records = external_sort(iter_csv(csv_filename), lambda record: static_hashing.hash(record.id_venta),
+                                Record.pack, Record.unpack, Record.SIZE_OF_RECORD, run_size)
+        n = ingest(records, static_hashing.bulk_load, batch_size, threaded)
+        static_hashing.flush()
+    return n
 
 class Record:
     # id de venta, nombre producto, cantidad vendida, precio unitario, fecha de venta
@@ -50,153 +86,928 @@ class Record:
     def __str__(self):
         return str(self.id_venta) + '|' + self.nombre_producto + '|' + str(self.cantidad_vendida) + '|' + str(self.precio_unitario) + '|' + self.fecha_venta
 
+def _record_key(record):
+    return record.id_venta
+
+def _find_in_bucket(bucket, id_venta):
+    # indice del registro con id_venta en el bucket (ordenado por clave) o None.
+    # el rango [min, max] de la cabecera descarta el bucket sin decodificar sus registros
+    if not bucket.min_key <= id_venta <= bucket.max_key:
+        return None
+    records = bucket.records
+    i = bisect_left(records, id_venta, key=_record_key)
+    return i if i < len(records) and records[i].id_venta == id_venta else None
+
+def _field_offsets(fmt):
+    # desplazamiento de cada campo de un formato struct (respetando la alineacion nativa)
+    codes = re.findall(r'\d*[a-zA-Z?]', fmt)
+    return [struct.calcsize(''.join(codes[:i + 1])) - struct.calcsize(code) for i, code in enumerate(codes)]
+
+class RecordView:
+    # vista de un registro dentro de un buffer (p.ej. el archivo mapeado en memoria):
+    # cada campo se decodifica recien cuando se pide, sin construir un Record
+    __slots__ = ('buffer', 'offset')
+    ID, NOMBRE, CANTIDAD, PRECIO, FECHA = _field_offsets(Record.FORMAT)
+    def __init__(self, buffer, offset = 0):
+        self.buffer = buffer
+        self.offset = offset
+    @property
+    def id_venta(self):
+        return struct.unpack_from('i', self.buffer, self.offset + self.ID)[0]
+    @property
+    def nombre_producto(self):
+        return struct.unpack_from('30s', self.buffer, self.offset + self.NOMBRE)[0].decode().rstrip()
+    @property
+    def cantidad_vendida(self):
+        return struct.unpack_from('i', self.buffer, self.offset + self.CANTIDAD)[0]
+    @property
+    def precio_unitario(self):
+        return struct.unpack_from('f', self.buffer, self.offset + self.PRECIO)[0]
+    @property
+    def fecha_venta(self):
+        return struct.unpack_from('10s', self.buffer, self.offset + self.FECHA)[0].decode().rstrip()
+    def to_record(self):
+        return Record.unpack(self.buffer[self.offset: self.offset + Record.SIZE_OF_RECORD])
+    def __str__(self):
+        return str(self.to_record())
+
 
 
 
 
 
-BLOCK_FACTOR = 4 # numero de registros por bloque
+PAGE_SIZE = 4096 # tamaño objetivo de un bucket (bytes); el block factor de cada archivo sale de aca
 N_MAIN_BUCKETS = 10 # numero de buckets principales
+EMPTY_MIN_KEY = 2**31 - 1 # min/max de la cabecera de un bucket vacio (min > max)
+EMPTY_MAX_KEY = -2**31
 
 class Bucket:
-    HEADER_FORMAT = 'ii' # size, next_bucket
+    # los registros de un bucket estan ordenados por id_venta y la cabecera guarda la menor y
+    # la mayor clave, asi una busqueda puede descartar el bucket leyendo solo la cabecera.
+    # los registros de un bucket leido se decodifican recien cuando se usan
+    HEADER_FORMAT = 'iiii' # size, next_bucket, min_key, max_key
     HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
-    SIZE_OF_BUCKET = HEADER_SIZE + BLOCK_FACTOR * Record.SIZE_OF_RECORD
-    def __init__(self, records = [], next_bucket = -1):
-        self.records = records
+    def __init__(self, records = None, next_bucket = -1):
+        self._records = records if records is not None else []
         self.next_bucket = next_bucket
-    def pack(self):
-        header_data = struct.pack(self.HEADER_FORMAT, len(self.records), self.next_bucket)
-        record_data = b''
-        for record in self.records:
-            record_data += record.pack()
-        i = len(self.records)
-        while i < BLOCK_FACTOR:
-            record_data += b'\x00' * Record.SIZE_OF_RECORD
-            i += 1
-        return header_data + record_data
+        self._raw = None # (size, bytes) del bucket leido mientras no se decodifique
+        self._min_key = EMPTY_MIN_KEY
+        self._max_key = EMPTY_MAX_KEY
+    @property
+    def records(self):
+        if self._records is None:
+            size, data = self._raw
+            self._records = [Record.unpack(data[offset: offset + Record.SIZE_OF_RECORD])
+                             for offset in range(Bucket.HEADER_SIZE, Bucket.HEADER_SIZE + size * Record.SIZE_OF_RECORD, Record.SIZE_OF_RECORD)]
+            self._raw = None
+        return self._records
+    @records.setter
+    def records(self, records):
+        self._records = records
+        self._raw = None
+    @property
+    def min_key(self):
+        # de la cabecera mientras no se decodifico; despues, de los registros (que pueden cambiar)
+        if self._records is None:
+            return self._min_key
+        return self._records[0].id_venta if self._records else EMPTY_MIN_KEY
+    @property
+    def max_key(self):
+        if self._records is None:
+            return self._max_key
+        return self._records[-1].id_venta if self._records else EMPTY_MAX_KEY
+    @staticmethod
+    def size_of(block_factor):
+        return Bucket.HEADER_SIZE + block_factor * Record.SIZE_OF_RECORD
+    @staticmethod
+    def block_factor_for(page_size):
+        # cuantos registros entran en un bucket de page_size bytes (al menos uno)
+        return max(1, (page_size - Bucket.HEADER_SIZE) // Record.SIZE_OF_RECORD)
+    def pack(self, block_factor):
+        if self.records:
+            min_key = min(record.id_venta for record in self.records)
+            max_key = max(record.id_venta for record in self.records)
+        else:
+            min_key, max_key = EMPTY_MIN_KEY, EMPTY_MAX_KEY
+        header_data = struct.pack(self.HEADER_FORMAT, len(self.records), self.next_bucket, min_key, max_key)
+        record_data = b''.join(record.pack() for record in self.records)
+        return header_data + record_data + b'\x00' * ((block_factor - len(self.records)) * Record.SIZE_OF_RECORD)
     @staticmethod
     def unpack(data : bytes):
-        size, next_bucket = struct.unpack(Bucket.HEADER_FORMAT, data[:Bucket.HEADER_SIZE])
-        offset = Bucket.HEADER_SIZE
-        records = []
-        for i in range(size):
-            record_data = data[offset: offset + Record.SIZE_OF_RECORD]
-            records.append(Record.unpack(record_data))
-            offset += Record.SIZE_OF_RECORD
-        return Bucket(records, next_bucket)
+        size, next_bucket, min_key, max_key = struct.unpack(Bucket.HEADER_FORMAT, data[:Bucket.HEADER_SIZE])
+        bucket = Bucket(None, next_bucket)
+        bucket._records = None
+        bucket._raw = (size, data)
+        bucket._min_key = min_key
+        bucket._max_key = max_key
+        return bucket
     
+class Header:
+    # cabecera del archivo: marca y version del formato, registros por bucket, inicio y
+    # largo de la lista de buckets libres. la marca distingue los archivos de formatos
+    # anteriores (sin cabecera o con otra), que no se pueden leer con este.
+    # la generacion cambia con cada sesion que modifica el archivo; los sidecars (.bloom,
+    # indice de productos) guardan la generacion con la que quedaron al dia
+    MAGIC = b'SHSH'
+    VERSION = 2
+    FORMAT = '4siiiii' # magic, version, block_factor, free_head, n_free, generation
+    SIZE = struct.calcsize(FORMAT)
+    def __init__(self, block_factor, free_head = -1, n_free = 0, generation = 0, magic = MAGIC, version = VERSION):
+        self.magic = magic
+        self.version = version
+        self.block_factor = block_factor
+        self.free_head = free_head
+        self.n_free = n_free
+        self.generation = generation
+    def pack(self):
+        return struct.pack(self.FORMAT, self.magic, self.version, self.block_factor, self.free_head, self.n_free, self.generation)
+    @staticmethod
+    def unpack(data: bytes):
+        magic, version, block_factor, free_head, n_free, generation = struct.unpack(Header.FORMAT, data)
+        return Header(block_factor, free_head, n_free, generation, magic, version)
+
 class StaticHashing:
-    def __init__(self, file):
+    def __init__(self, file, pool: BufferPool = None, use_mmap: bool = False, bloom: bool = False,
+                 product_index: ProductIndex = None, concurrent: bool = False, metrics: Metrics = None,
+                 wal: WriteAheadLog = None, page_size: int = PAGE_SIZE):
+        if use_mmap and concurrent:
+            raise ValueError("El modo mmap no se puede combinar con el modo concurrente")
+        if wal and concurrent:
+            raise ValueError("El modo WAL no se puede combinar con el modo concurrente")
         self.file = file
+        self.wal = None
+        # contadores de E/S por operacion (opcional)
+        self.metrics = metrics
+        # modo mmap: search y scanAll leen directo del archivo mapeado, sin pasar por el pool
+        self.use_mmap = use_mmap
+        self.mm = None
+        self.view = None
+        # los buckets se leen y escriben a traves del buffer pool (compartible con otras estructuras)
+        self.pool = pool if pool is not None else BufferPool()
+        self.owner = os.path.abspath(file.name) if isinstance(getattr(file, 'name', None), str) else id(file)
         self.file.seek(0,2)
         filesize = self.file.tell()
-        if filesize < N_MAIN_BUCKETS * Bucket.SIZE_OF_BUCKET:
-            # inicializar el archivo con buckets vacios
+        self.header = None
+        if filesize > 0:
+            # un archivo con datos nunca se reinicializa: si no tiene la cabecera de este
+            # formato se falla (hay que recrearlo, p.ej. con bulk_load_csv desde el CSV)
             self.file.seek(0)
+            data = self.file.read(Header.SIZE)
+            if len(data) < Header.SIZE or Header.unpack(data).magic != Header.MAGIC:
+                raise ValueError(f"{file.name}: no es un archivo hash con cabecera (formato anterior o desconocido)")
+            self.header = Header.unpack(data)
+            if self.header.version != Header.VERSION:
+                raise ValueError(f"{file.name}: version de archivo hash {self.header.version} "
+                                 f"(se esperaba {Header.VERSION})")
+            if self.header.block_factor < 1 or filesize < Header.SIZE + N_MAIN_BUCKETS * Bucket.size_of(self.header.block_factor):
+                raise ValueError(f"{file.name}: cabecera de archivo hash invalida")
+        new_file = self.header is None
+        if new_file:
+            # inicializar el archivo con la cabecera y buckets vacios; el block factor se
+            # elige una vez, al crear el archivo, y despues se lee de la cabecera
+            self.pool.invalidate(self.owner)
+            self.header = Header(Bucket.block_factor_for(page_size))
+        self.block_factor = self.header.block_factor
+        self.bucket_size = Bucket.size_of(self.block_factor)
+        if new_file:
+            self.file.seek(0)
+            self.file.write(self.header.pack())
             for _ in range(N_MAIN_BUCKETS):
-                bucket = Bucket()
-                self.file.write(bucket.pack())
+                bucket = Bucket([])
+                self.file.write(bucket.pack(self.block_factor))
+        self.header_dirty = False
+        # bulk_load: bucket_index -> pos del primer bucket de la cadena con espacio (o del
+        # ultimo si estan todos llenos), asi el lote siguiente no recorre la cadena desde el
+        # principio. add/delete/compact pueden abrir lugar antes del cursor y lo descartan
+        self.load_cursors = {}
+        # si en esta sesion ya se incremento la generacion (ver _begin_write)
+        self.generation_written = False
+        # modo concurrente: E/S posicional (pread/pwrite, sin posicion compartida), un latch
+        # lector/escritor por cadena y la asignacion de buckets al final protegida por un lock
+        self.concurrent = concurrent
+        self.alloc_lock = threading.RLock()
+        if concurrent:
+            self.file.flush()
+            self.fd = self.file.fileno()
+            self.file_end = os.fstat(self.fd).st_size
+            self.latches = [RWLatch() for _ in range(N_MAIN_BUCKETS)]
+        # filtros de Bloom por cadena (sidecar .bloom) para cortar las busquedas sin resultado
+        self.filters = None
+        if bloom:
+            # un sidecar de otra generacion no refleja los cambios hechos sin filtros (o
+            # perdidos en una caida): se reconstruye desde los datos
+            self.filters = ChainFilters(file.name + '.bloom', N_MAIN_BUCKETS, self.header.generation)
+            if new_file or not self.filters.loaded:
+                self._rebuild_filters()
+        # indice secundario sobre nombre_producto: (nombre) -> [(pos del bucket, id_venta)].
+        # como el .bloom, un indice de otra generacion se reconstruye
+        self.product_index = product_index
+        if product_index and (new_file or product_index.new_file or product_index.generation != self.header.generation):
+            self._rebuild_product_index()
+        # modo WAL: add/delete solo se registran en el log y en su memtable; el archivo se
+        # actualiza en los checkpoints. al abrir se aplica lo que haya quedado en el log
+        self.wal = wal
+        if wal and wal.memtable:
+            self.checkpoint()
+    def _latch(self, bucket_index, write = False):
+        if not self.concurrent:
+            return nullcontext()
+        latch = self.latches[bucket_index]
+        return write_locked(latch) if write else read_locked(latch)
+    def _latch_all(self, write = False):
+        # todas las cadenas, siempre en el mismo orden para no generar deadlocks
+        stack = ExitStack()
+        for bucket_index in range(N_MAIN_BUCKETS):
+            stack.enter_context(self._latch(bucket_index, write))
+        return stack
     def hash(self, key):
         return key % N_MAIN_BUCKETS
+    def _bucket_pos(self, bucket_index):
+        return Header.SIZE + bucket_index * self.bucket_size
+    def _count(self, counter, n = 1):
+        if self.metrics:
+            self.metrics.count(counter, n)
+    def _count_read(self, pos, mapped = False):
+        # toda lectura de un bucket fuera de la zona principal es un salto por la cadena de overflow.
+        # en modo mmap el bucket se lee del archivo mapeado, sin pasar por el pool
+        if mapped:
+            self._count('reads')
+        if pos >= self._bucket_pos(N_MAIN_BUCKETS):
+            self._count('overflow_hops')
+    def _read_bucket(self, pos):
+        self._count_read(pos)
+        hit = True
+        def load():
+            nonlocal hit
+            hit = False
+            return self._read_raw(pos)
+        bucket = self.pool.get(self.owner, pos, load)
+        if hit:
+            self._count('pool_hits')
+        return bucket
+    def _begin_write(self):
+        # la primera escritura de datos despues de abrir (o de un flush) incrementa la
+        # generacion y la escribe antes que los datos: si la sesion no llega a guardar los
+        # sidecars, al reabrir no coinciden con el archivo y se reconstruyen
+        if self.generation_written:
+            return
+        with self.alloc_lock:
+            if not self.generation_written:
+                self.header.generation += 1
+                self._write_bytes(0, self.header.pack())
+                self.generation_written = True
+    def _write_bucket(self, pos, bucket):
+        self._begin_write()
+        self.load_cursors.clear()
+        if self.concurrent:
+            # el pool puede desalojar el frame desde otro hilo, que no tiene el latch de esta
+            # cadena: se empaqueta ahora (con el latch tomado) y en la eviccion o el flush
+            # se escriben esos bytes y no el bucket, que su escritor puede estar modificando
+            data = bucket.pack(self.block_factor)
+            self.pool.put(self.owner, pos, bucket, lambda pos, _: self._store(pos, data))
+            return
+        self.pool.put(self.owner, pos, bucket, self._write_raw)
+    def _read_raw(self, pos):
+        self._count('reads')
+        self._count('bytes_read', self.bucket_size)
+        if self.concurrent:
+            return Bucket.unpack(os.pread(self.fd, self.bucket_size, pos))
+        self.file.seek(pos)
+        return Bucket.unpack(self.file.read(self.bucket_size))
+    def _write_raw(self, pos, bucket):
+        self._store(pos, bucket.pack(self.block_factor))
+    def _store(self, pos, data):
+        # escritura de un bucket en disco (desde el pool: en el flush o en una eviccion)
+        self._count('writes')
+        self._write_bytes(pos, data)
+    def _write_bytes(self, pos, data):
+        if self.concurrent:
+            os.pwrite(self.fd, data, pos)
+            return
+        self.file.seek(pos)
+        self.file.write(data)
+    def _file_size(self):
+        if self.concurrent:
+            return self.file_end
+        self.file.seek(0,2)
+        return self.file.tell()
+    def _append_bytes(self, data):
+        # reserva el espacio al final del archivo de forma atomica y escribe ahi
+        self._begin_write()
+        self.load_cursors.clear()
+        with self.alloc_lock:
+            pos = self._file_size()
+            if self.concurrent:
+                self.file_end += len(data)
+            else:
+                self.file.write(data)
+                return pos
+        os.pwrite(self.fd, data, pos)
+        return pos
+    def _mapped(self, pos):
+        # devuelve un memoryview del archivo mapeado que cubre el bucket en pos;
+        # antes se bajan a disco los buckets pendientes para que el mapa este al dia
+        self.pool.flush(self.owner)
+        self.file.flush()
+        if self.mm is None or pos + self.bucket_size > len(self.mm):
+            self._unmap()
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mm)
+        return self.view
+    def _unmap(self):
+        if self.mm is not None:
+            self.view.release()
+            self.mm.close()
+            self.mm = self.view = None
+    def close(self):
+        # se puede llamar mas de una vez: el WAL solo se aplica y se cierra la primera
+        if self.wal and self.wal.closed:
+            return
+        self.flush()
+        self._unmap()
+        if self.wal:
+            self.wal.close()
+    def _allocate_bucket(self, bucket):
+        # reutiliza un bucket de la lista libre; si no hay, lo agrega al final del archivo
+        with self.alloc_lock:
+            if self.header.free_head != -1:
+                pos = self.header.free_head
+                self.header.free_head = self._read_bucket(pos).next_bucket
+                self.header.n_free -= 1
+                self.header_dirty = True
+                self._write_bucket(pos, bucket)
+                return pos
+        pos = self._append_bytes(bucket.pack(self.block_factor))
+        self._count('writes')
+        self.pool.put(self.owner, pos, bucket, self._write_raw, dirty=False)
+        return pos
+    def _free_bucket(self, pos):
+        # un bucket libre queda vacio y enlazado (por next_bucket) al resto de la lista libre
+        with self.alloc_lock:
+            self._write_bucket(pos, Bucket([], self.header.free_head))
+            self.header.free_head = pos
+            self.header.n_free += 1
+            self.header_dirty = True
+    def _rebuild_filters(self):
+        for bucket_index in range(N_MAIN_BUCKETS):
+            self._resize_filter(bucket_index)
+    def _resize_filter(self, bucket_index):
+        self.filters.resize(bucket_index, (record.id_venta for _, bucket in self._read_chain(bucket_index)
+                                           for record in bucket.records))
+    def _grow_filter(self, bucket_index):
+        # el filtro de una cadena se dimensiona por sus claves; si crecio de mas se rearma
+        # (con el latch de escritura de la cadena tomado)
+        if self.filters and self.filters.needs_resize(bucket_index):
+            self._resize_filter(bucket_index)
+    def _rebuild_product_index(self):
+        self.product_index.clear()
+        for bucket_index in range(N_MAIN_BUCKETS):
+            for pos, bucket in self._read_chain(bucket_index):
+                for record in bucket.records:
+                    self.product_index.add(record.nombre_producto, pos, record.id_venta)
+    def _index_add(self, record, pos):
+        if self.product_index:
+            self.product_index.add(record.nombre_producto, pos, record.id_venta)
+            self._count('index_rewrites')
+    def _index_remove(self, record, pos):
+        if self.product_index:
+            self.product_index.remove(record.nombre_producto, pos, record.id_venta)
+            self._count('index_rewrites')
+    @measured('search_by_product')
+    def search_by_product(self, nombre_producto):
+        # todos los registros de un producto, leyendo solo los buckets que los contienen
+        if not self.product_index:
+            raise ValueError("search_by_product necesita un indice de productos (parametro product_index)")
+        if self.wal:
+            self.checkpoint()
+        with self._latch_all():
+            by_bucket = {}
+            for pos, id_venta in self.product_index.lookup(nombre_producto):
+                by_bucket.setdefault(pos, set()).add(id_venta)
+            result = []
+            for pos in sorted(by_bucket):
+                # los ids repetidos en el bucket se separan por el nombre del producto
+                ids = by_bucket[pos]
+                result.extend(record for record in self._read_bucket(pos).records
+                              if record.id_venta in ids and same_product(record.nombre_producto, nombre_producto))
+            return result
+    @measured('stats')
+    def stats(self):
+        # forma del archivo: largo de las cadenas, ocupacion de los buckets, proporcion de
+        # overflow y uso del indice secundario (mas los contadores de E/S si hay metricas)
+        if self.wal:
+            self.checkpoint()
+        with self._latch_all():
+            chains = [self._read_chain(bucket_index) for bucket_index in range(N_MAIN_BUCKETS)]
+        fills = [len(bucket.records) for chain in chains for _, bucket in chain]
+        overflow_buckets = len(fills) - N_MAIN_BUCKETS
+        return {
+            'records': sum(fills),
+            'block_factor': self.block_factor,
+            'main_buckets': N_MAIN_BUCKETS,
+            'overflow_buckets': overflow_buckets,
+            'free_buckets': self.header.n_free,
+            'chain_length': histogram(len(chain) for chain in chains),
+            'bucket_fill': histogram(fills),
+            'overflow_ratio': overflow_buckets / len(fills),
+            'index_utilization': self.product_index.utilization() if self.product_index else None,
+            'operations': self.metrics.to_dict() if self.metrics else None,
+        }
+    def bloom_stats(self):
+        # tasa de falsos positivos estimada y observada de los filtros de Bloom
+        return self.filters.stats() if self.filters else None
+    def flush(self):
+        # en modo WAL bajar a disco es aplicar un checkpoint
+        if self.wal:
+            self.checkpoint()
+        else:
+            self._flush_data()
+    def _flush_data(self):
+        # escribe en disco los buckets modificados que siguen en el buffer pool
+        self.pool.flush(self.owner)
+        with self.alloc_lock:
+            if self.header_dirty:
+                self._write_bytes(0, self.header.pack())
+                self.header_dirty = False
+            # los sidecars quedan con esta generacion; la proxima escritura la vuelve a cambiar
+            generation = self.header.generation
+            self.generation_written = False
+        self.file.flush()
+        if self.filters:
+            self.filters.save(generation)
+        if self.product_index:
+            self.product_index.flush(generation)
+    @measured('checkpoint')
+    def checkpoint(self):
+        # aplica al archivo las operaciones pendientes del WAL y recien despues vacia el log.
+        # cada clave se borra antes de volver a insertarla (upsert), asi si el checkpoint se
+        # corta y se repite al reabrir, el resultado es el mismo. sin WAL no hay nada
+        # pendiente: solo se bajan a disco los buckets modificados
+        if not self.wal:
+            self.flush()
+            return
+        for id_venta, payload in self.wal.memtable.items():
+            # el borrado del upsert no es una consulta: no cuenta en las estadisticas del filtro
+            self._apply_delete(id_venta, count_negatives=False)
+            if payload is not None:
+                self._apply_add(Record.unpack(payload))
+        self._flush_data()
+        os.fsync(self.file.fileno())
+        self.wal.reset()
+    @measured('add')
     def add(self, record: Record):
+        # el buffer pool guarda el registro tal como queda en disco (y no el objeto del llamador)
+        record = Record.unpack(record.pack())
+        if self.wal:
+            # en modo WAL un add reemplaza al registro con el mismo id, si existe
+            self.wal.put(record.id_venta, record.pack())
+            if self.wal.needs_checkpoint():
+                self.checkpoint()
+            return
+        self._apply_add(record)
+    def _apply_add(self, record):
         bucket_index = self.hash(record.id_venta)
-        pos = bucket_index * Bucket.SIZE_OF_BUCKET
-        self.file.seek(pos)
-        bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
+        with self._latch(bucket_index, write=True):
+            self._add_in_chain(bucket_index, record)
+            self._grow_filter(bucket_index)
+    def _add_in_chain(self, bucket_index, record):
+        if self.filters:
+            self.filters.add(bucket_index, record.id_venta)
+        pos = self._bucket_pos(bucket_index)
+        bucket = self._read_bucket(pos)
         # buscar espacio en el main bucket
-        if len(bucket.records) < BLOCK_FACTOR:
-            bucket.records.append(record)
-            self.file.seek(pos)
-            self.file.write(bucket.pack())
+        if len(bucket.records) < self.block_factor:
+            self._insert_sorted(pos, bucket, record)
             return
         # no hay espacio en el main bucket, buscar en los overflow buckets
         prev_bucket_pos = pos
         while bucket.next_bucket != -1:
             prev_bucket_pos = bucket.next_bucket
-            self.file.seek(bucket.next_bucket)
-            bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
-            if len(bucket.records) < BLOCK_FACTOR:
-                bucket.records.append(record)
-                self.file.seek(prev_bucket_pos)
-                self.file.write(bucket.pack())
+            bucket = self._read_bucket(bucket.next_bucket)
+            if len(bucket.records) < self.block_factor:
+                self._insert_sorted(prev_bucket_pos, bucket, record)
                 return
         # no hay espacio en los overflow buckets, crear uno nuevo
-        new_bucket = Bucket([record])
-        self.file.seek(0,2)
-        new_bucket_pos = self.file.tell()
-        self.file.write(new_bucket.pack())
+        new_bucket_pos = self._allocate_bucket(Bucket([record]))
+        self._index_add(record, new_bucket_pos)
         # actualizar el puntero del ultimo bucket
         bucket.next_bucket = new_bucket_pos
-        self.file.seek(prev_bucket_pos)
-        self.file.write(bucket.pack())
+        self._write_bucket(prev_bucket_pos, bucket)
+    def _insert_sorted(self, pos, bucket, record):
+        # inserta manteniendo el bucket ordenado por id_venta (el indice secundario no guarda
+        # slots, asi que los registros que se corren no lo tocan)
+        bucket.records.insert(bisect_right(bucket.records, record.id_venta, key=_record_key), record)
+        self._write_bucket(pos, bucket)
+        self._index_add(record, pos)
+    @measured('bulk_load')
+    def bulk_load(self, records):
+        # carga masiva: agrupa los registros por bucket y escribe los buckets principales y
+        # de overflow que cambiaron en una sola pasada, en orden de posicion.
+        # el archivo resultante es identico al que produce add() registro a registro.
+        # cada cadena se recorre desde su cursor (ver load_cursors): un lote no vuelve a
+        # leer los buckets llenos que dejaron los lotes anteriores ni los guarda en memoria
+        if self.wal:
+            self.checkpoint()
+        with self._latch_all(write=True):
+            self._flush_data()
+            end = self._file_size()
+            chains = {} # bucket_index -> [pos, bucket] del bucket actual de la cadena en este lote
+            dirty = {}  # pos -> bucket a escribir
+            touched = {} # pos -> bucket de los buckets que reciben registros
+            for record in records:
+                bucket_index = self.hash(record.id_venta)
+                chain = chains.get(bucket_index)
+                if chain is None:
+                    pos = self.load_cursors.get(bucket_index, self._bucket_pos(bucket_index))
+                    chain = chains[bucket_index] = [pos, self._read_bucket(pos)]
+                # add() inserta en el primer bucket de la cadena con espacio; como en la
+                # carga los buckets solo se llenan, basta con avanzar por next_bucket
+                while len(chain[1].records) >= self.block_factor and chain[1].next_bucket != -1:
+                    chain[0] = chain[1].next_bucket
+                    chain[1] = self._read_bucket(chain[0])
+                if len(chain[1].records) >= self.block_factor:
+                    # cadena llena: nuevo bucket de overflow (de la lista libre o al final del archivo)
+                    if self.header.free_head != -1:
+                        new_pos = self.header.free_head
+                        self.header.free_head = self._read_bucket(new_pos).next_bucket
+                        self.header.n_free -= 1
+                        self.header_dirty = True
+                    else:
+                        new_pos = end
+                        end += self.bucket_size
+                    chain[1].next_bucket = new_pos
+                    dirty[chain[0]] = chain[1]
+                    chain[0], chain[1] = new_pos, Bucket([])
+                pos, bucket = chain
+                record = Record.unpack(record.pack())
+                bucket.records.append(record)
+                touched[pos] = bucket
+                if self.filters:
+                    self.filters.add(bucket_index, record.id_venta)
+                self._index_add(record, pos)
+                dirty[pos] = bucket
+            # cada bucket que recibio registros queda ordenado por id_venta, como lo deja add()
+            # (el sort es estable: las claves repetidas quedan en orden de llegada)
+            for bucket in touched.values():
+                bucket.records.sort(key=_record_key)
+            # escribir en orden de posicion, agrupando los buckets contiguos en un solo write
+            run_start = -1
+            run_data = []
+            self._count('writes', len(dirty))
+            if dirty:
+                self._begin_write()
+            for pos in sorted(dirty):
+                if run_data and pos != run_start + len(run_data) * self.bucket_size:
+                    self._write_bytes(run_start, b''.join(run_data))
+                    run_data = []
+                if not run_data:
+                    run_start = pos
+                run_data.append(dirty[pos].pack(self.block_factor))
+                self.pool.put(self.owner, pos, dirty[pos], self._write_raw, dirty=False)
+            if run_data:
+                self._write_bytes(run_start, b''.join(run_data))
+            if self.concurrent:
+                self.file_end = max(self.file_end, end)
+            # el cursor de cada cadena queda en el primer bucket con espacio (o en el ultimo)
+            # para el proximo lote; cualquier otra escritura los descarta
+            for bucket_index, (pos, _) in chains.items():
+                self.load_cursors[bucket_index] = pos
+                self._grow_filter(bucket_index)
+    def _read_chain(self, bucket_index):
+        # lee la cadena completa (bucket principal + overflow) como lista de (pos, bucket)
+        pos = self._bucket_pos(bucket_index)
+        chain = []
+        while pos != -1:
+            bucket = self._read_bucket(pos)
+            chain.append((pos, bucket))
+            pos = bucket.next_bucket
+        return chain
+    @measured('compact')
+    def compact(self):
+        # reempaqueta cada cadena en la menor cantidad de buckets (conservando las posiciones
+        # mas bajas), libera los sobrantes y recorta del archivo los buckets libres del final
+        if self.wal:
+            self.checkpoint()
+        with self._latch_all(write=True):
+            for bucket_index in range(N_MAIN_BUCKETS):
+                chain = self._read_chain(bucket_index)
+                block_factor = self.block_factor
+                n_buckets = max(1, (sum(len(bucket.records) for _, bucket in chain) + block_factor - 1) // block_factor)
+                if n_buckets == len(chain):
+                    continue
+                # toda la cadena se ordena por id_venta: cada bucket queda con un rango de
+                # claves propio y las busquedas descartan el resto por su min/max
+                located = sorted(((record, pos) for pos, bucket in chain for record in bucket.records),
+                                 key=lambda item: item[0].id_venta)
+                records = [record for record, _ in located]
+                old_positions = [pos for _, pos in located]
+                overflow_positions = sorted(pos for pos, _ in chain[1:])
+                positions = [chain[0][0]] + overflow_positions[:n_buckets - 1]
+                for i, pos in enumerate(positions):
+                    next_bucket = positions[i + 1] if i + 1 < len(positions) else -1
+                    self._write_bucket(pos, Bucket(records[i * block_factor:(i + 1) * block_factor], next_bucket))
+                # en el indice secundario solo cambian los registros que pasaron a otro bucket
+                for k, record in enumerate(records):
+                    new_pos = positions[k // block_factor]
+                    if old_positions[k] != new_pos:
+                        self._index_remove(record, old_positions[k])
+                        self._index_add(record, new_pos)
+                for pos in overflow_positions[n_buckets - 1:]:
+                    self._free_bucket(pos)
+            self._truncate_free_tail()
+    def _truncate_free_tail(self):
+        free = []
+        pos = self.header.free_head
+        while pos != -1:
+            free.append(pos)
+            pos = self._read_bucket(pos).next_bucket
+        free.sort()
+        self._flush_data()
+        end = self._file_size()
+        while free and free[-1] == end - self.bucket_size:
+            end = free.pop()
+        # rearmar la lista libre en orden de posicion para reutilizar primero los buckets bajos
+        self.header.free_head = -1
+        self.header.n_free = len(free)
+        for pos in reversed(free):
+            self._write_bucket(pos, Bucket([], self.header.free_head))
+            self.header.free_head = pos
+        self.header_dirty = True
+        self._flush_data()
+        self._unmap()
+        if self.concurrent:
+            os.ftruncate(self.fd, end)
+            self.file_end = end
+        else:
+            self.file.truncate(end)
+        self.pool.invalidate(self.owner)
+    def _bucket_records(self, pos):
+        # (registros, next_bucket) del bucket en pos; en modo mmap los registros son una
+        # unica RecordView que se va desplazando, sin crear un objeto por registro
+        if not self.use_mmap:
+            bucket = self._read_bucket(pos)
+            return bucket.records, bucket.next_bucket
+        view = self._mapped(pos)
+        self._count_read(pos, mapped=True)
+        size, next_bucket, _, _ = struct.unpack_from(Bucket.HEADER_FORMAT, view, pos)
+        return self._views(view, pos + Bucket.HEADER_SIZE, size), next_bucket
+    def _views(self, view, offset, size):
+        record_view = RecordView(view)
+        for i in range(size):
+            record_view.offset = offset + i * Record.SIZE_OF_RECORD
+            yield record_view
+    def iter_buckets(self, start = 0, stop = N_MAIN_BUCKETS):
+        # generador de (bucket_index, pos, bucket) de las cadenas start..stop (sin incluir).
+        # cada cadena se lee completa bajo su latch y recien despues se entrega, para no
+        # dejar el latch tomado mientras el generador esta suspendido
+        if self.wal:
+            self.checkpoint()
+        for bucket_index in range(start, stop):
+            with self._latch(bucket_index):
+                chain = self._read_chain(bucket_index)
+            for pos, bucket in chain:
+                yield bucket_index, pos, bucket
+    def iter_records(self, start = 0, stop = N_MAIN_BUCKETS):
+        for _, _, bucket in self.iter_buckets(start, stop):
+            yield from bucket.records
+    @measured('scanAll')
     def scanAll(self):
-        self.file.seek(0,2)
-        filesize = self.file.tell()
+        if self.wal:
+            self.checkpoint()
         # Solo recorrer los buckets principales
         for i in range(N_MAIN_BUCKETS):
-            pos = i * Bucket.SIZE_OF_BUCKET
-            self.file.seek(pos)
-            bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
-            print(f"--- Bucket {i} (principal) ---")
-            for record in bucket.records:
-                print(record)
-            # Recorrer los overflow buckets
-            overflow_idx = 1
-            next_pos = bucket.next_bucket
-            while next_pos != -1:
-                self.file.seek(next_pos)
-                overflow_bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
-                print(f"    --- Overflow {overflow_idx} de Bucket {i} ---")
-                for record in overflow_bucket.records:
-                    print("    ", record)
-                next_pos = overflow_bucket.next_bucket
-                overflow_idx += 1
+            with self._latch(i):
+                records, next_pos = self._bucket_records(self._bucket_pos(i))
+                print(f"--- Bucket {i} (principal) ---")
+                for record in records:
+                    print(record)
+                # Recorrer los overflow buckets
+                overflow_idx = 1
+                while next_pos != -1:
+                    records, next_pos = self._bucket_records(next_pos)
+                    print(f"    --- Overflow {overflow_idx} de Bucket {i} ---")
+                    for record in records:
+                        print("    ", record)
+                    overflow_idx += 1
+    def _search_mmap(self, id_venta):
+        # compara las claves en el archivo mapeado y solo construye el Record que coincide
+        pos = self._bucket_pos(self.hash(id_venta))
+        while pos != -1:
+            view = self._mapped(pos)
+            self._count_read(pos, mapped=True)
+            size, next_bucket, min_key, max_key = struct.unpack_from(Bucket.HEADER_FORMAT, view, pos)
+            if min_key <= id_venta <= max_key:
+                # busqueda binaria sobre las claves del bucket, ordenadas por id_venta
+                base = pos + Bucket.HEADER_SIZE
+                low, high = 0, size
+                while low < high:
+                    middle = (low + high) // 2
+                    if struct.unpack_from('i', view, base + middle * Record.SIZE_OF_RECORD)[0] < id_venta:
+                        low = middle + 1
+                    else:
+                        high = middle
+                offset = base + low * Record.SIZE_OF_RECORD
+                if low < size and struct.unpack_from('i', view, offset)[0] == id_venta:
+                    return Record.unpack(view[offset: offset + Record.SIZE_OF_RECORD])
+            pos = next_bucket
+        return None
+    def _filtered_out(self, id_venta, count_negatives = True):
+        # True si el filtro de Bloom asegura que la clave no existe (no hace falta leer la cadena)
+        if self.filters and not self.filters.might_contain(self.hash(id_venta), id_venta):
+            if count_negatives:
+                self.filters.record_negative(skipped=True)
+            return True
+        return False
+    @measured('search')
     def search(self, id_venta):
-        bucket_index = self.hash(id_venta)
-        pos = bucket_index * Bucket.SIZE_OF_BUCKET
-        self.file.seek(pos)
-        bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
-        for record in bucket.records:
-            if record.id_venta == id_venta:
-                return record
-        while bucket.next_bucket != -1:
-            self.file.seek(bucket.next_bucket)
-            bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
-            for record in bucket.records:
-                if record.id_venta == id_venta:
-                    return record
+        if self.wal:
+            payload = self.wal.lookup(id_venta)
+            if payload is not MISSING:
+                return Record.unpack(payload) if payload is not None else None
+        with self._latch(self.hash(id_venta)):
+            if self._filtered_out(id_venta):
+                return None
+            record = self._search_mmap(id_venta) if self.use_mmap else self._search_chain(id_venta)
+        if record is None and self.filters:
+            self.filters.record_negative(skipped=False)
+        return record
+    def _search_chain(self, id_venta):
+        pos = self._bucket_pos(self.hash(id_venta))
+        while pos != -1:
+            bucket = self._read_bucket(pos)
+            i = _find_in_bucket(bucket, id_venta)
+            if i is not None:
+                return bucket.records[i]
+            pos = bucket.next_bucket
         return None
+    @measured('search_many')
+    def search_many(self, ids):
+        # busqueda por lotes: agrupa las claves por bucket y recorre cada cadena una sola vez.
+        # devuelve [(id_venta, record)] en el orden de entrada; record es None si no existe
+        ids = list(ids) # se recorre dos veces (agrupar y armar el resultado): puede ser un generador
+        by_bucket = {}
+        found = {}
+        for id_venta in ids:
+            if self.wal:
+                payload = self.wal.lookup(id_venta)
+                if payload is not MISSING:
+                    found[id_venta] = Record.unpack(payload) if payload is not None else None
+                    continue
+            by_bucket.setdefault(self.hash(id_venta), set()).add(id_venta)
+        for bucket_index, pending in by_bucket.items():
+            with self._latch(bucket_index):
+                pending = {id_venta for id_venta in pending if not self._filtered_out(id_venta)}
+                pos = self._bucket_pos(bucket_index)
+                while pos != -1 and pending:
+                    bucket = self._read_bucket(pos)
+                    for id_venta in list(pending):
+                        i = _find_in_bucket(bucket, id_venta)
+                        if i is not None:
+                            found[id_venta] = bucket.records[i]
+                            pending.discard(id_venta)
+                    pos = bucket.next_bucket
+            if self.filters:
+                for _ in pending:
+                    self.filters.record_negative(skipped=False)
+        return [(id_venta, found.get(id_venta)) for id_venta in ids]
+    @measured('delete')
     def delete(self, id_venta):
-        bucket_index = self.hash(id_venta)
-        pos = bucket_index * Bucket.SIZE_OF_BUCKET
-        self.file.seek(pos)
-        bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
+        if self.wal:
+            if self.search(id_venta) is None:
+                return False
+            self.wal.delete(id_venta)
+            if self.wal.needs_checkpoint():
+                self.checkpoint()
+            return True
+        return self._apply_delete(id_venta)
+    def _apply_delete(self, id_venta, count_negatives = True):
+        with self._latch(self.hash(id_venta), write=True):
+            if self._filtered_out(id_venta, count_negatives):
+                return False
+            if not self._delete_in_chain(id_venta):
+                if self.filters and count_negatives:
+                    self.filters.record_negative(skipped=False)
+                return False
+            if self.filters:
+                self.filters.remove(self.hash(id_venta), id_venta)
+            return True
+    def _delete_in_chain(self, id_venta):
+        pos = self._bucket_pos(self.hash(id_venta))
+        bucket = self._read_bucket(pos)
         # buscar y eliminar en el main bucket
-        for i, record in enumerate(bucket.records):
-            if record.id_venta == id_venta:
-                del bucket.records[i]
-                self.file.seek(pos)
-                self.file.write(bucket.pack())
-                return True
+        i = _find_in_bucket(bucket, id_venta)
+        if i is not None:
+            record = bucket.records.pop(i)
+            self._write_bucket(pos, bucket)
+            self._index_remove(record, pos)
+            return True
         # buscar y eliminar en los overflow buckets
-        prev_bucket_pos = pos
-        while bucket.next_bucket != -1:
-            prev_bucket_pos = bucket.next_bucket
-            self.file.seek(bucket.next_bucket)
-            bucket = Bucket.unpack(self.file.read(Bucket.SIZE_OF_BUCKET))
-            for i, record in enumerate(bucket.records):
-                if record.id_venta == id_venta:
-                    del bucket.records[i]
-                    self.file.seek(prev_bucket_pos)
-                    self.file.write(bucket.pack())
-                    return True
+        prev_bucket, prev_bucket_pos = bucket, pos
+        while prev_bucket.next_bucket != -1:
+            bucket_pos = prev_bucket.next_bucket
+            bucket = self._read_bucket(bucket_pos)
+            i = _find_in_bucket(bucket, id_venta)
+            if i is not None:
+                record = bucket.records.pop(i)
+                self._index_remove(record, bucket_pos)
+                if bucket.records:
+                    self._write_bucket(bucket_pos, bucket)
+                else:
+                    # overflow vacio: se desengancha de la cadena y pasa a la lista libre
+                    prev_bucket.next_bucket = bucket.next_bucket
+                    self._write_bucket(prev_bucket_pos, prev_bucket)
+                    self._free_bucket(bucket_pos)
+                return True
+            prev_bucket, prev_bucket_pos = bucket, bucket_pos
         return False
-    
+
+
+DEMO_PAGE_SIZE = Bucket.size_of(4) # buckets de 4 registros: el demo y la prueba de estres generan overflow
+
+def stress_test(filename, n_threads = 8, ops_per_thread = 300):
+    # add/search/delete en paralelo sobre un archivo en modo concurrente; cada hilo trabaja
+    # sobre sus propios ids (que caen en todas las cadenas) y verifica cada resultado.
+    # al final se reabre el archivo sin modo concurrente y se compara con lo esperado
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    if os.path.exists(filename):
+        os.remove(filename)
+    pool = BufferPool(capacity=16) # pool chico para forzar evicciones entre hilos
+    def worker(thread_id):
+        rng = random.Random(thread_id)
+        alive = {}
+        errors = []
+        for i in range(ops_per_thread):
+            op = rng.random()
+            if op < 0.5 or not alive:
+                id_venta = thread_id + n_threads * i
+                record = Record(id_venta, f"Producto {id_venta % 7}", i, 1.5, "2024-01-01")
+                static_hashing.add(record)
+                alive[id_venta] = record.nombre_producto
+            elif op < 0.8:
+                id_venta = rng.choice(list(alive))
+                found = static_hashing.search(id_venta)
+                if found is None or found.id_venta != id_venta:
+                    errors.append(f"search({id_venta}) -> {found}")
+                missing = static_hashing.search(-1 - id_venta)
+                if missing is not None:
+                    errors.append(f"search({-1 - id_venta}) -> {missing}")
+            else:
+                id_venta = rng.choice(list(alive))
+                if not static_hashing.delete(id_venta):
+                    errors.append(f"delete({id_venta}) -> False")
+                del alive[id_venta]
+                if static_hashing.search(id_venta) is not None:
+                    errors.append(f"search({id_venta}) despues de borrar")
+        return alive, errors
+    with open(filename, 'w+b') as file:
+        static_hashing = StaticHashing(file, pool, bloom=True, concurrent=True, page_size=DEMO_PAGE_SIZE)
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            results = list(executor.map(worker, range(n_threads)))
+        static_hashing.close()
+    expected = {}
+    errors = []
+    for alive, thread_errors in results:
+        expected.update(alive)
+        errors.extend(thread_errors)
+    with open(filename, 'r+b') as file:
+        static_hashing = StaticHashing(file)
+        stored = {}
+        for bucket_index in range(N_MAIN_BUCKETS):
+            for _, bucket in static_hashing._read_chain(bucket_index):
+                for record in bucket.records:
+                    if record.id_venta in stored:
+                        errors.append(f"id {record.id_venta} duplicado")
+                    stored[record.id_venta] = record.nombre_producto
+    if stored != expected:
+        errors.append(f"contenido final: {len(stored)} registros, se esperaban {len(expected)}")
+    for name in (filename, filename + '.bloom'):
+        if os.path.exists(name):
+            os.remove(name)
+    return errors
+
 
 if __name__ == "__main__":
+    if len(sys.argv) in (4, 5) and sys.argv[1] == 'bulk-load':
+        # uso: python static_hashing.py bulk-load <archivo.csv> <archivo.dat> [tamaño de lote]
+        batch_size = int(sys.argv[4]) if len(sys.argv) == 5 else DEFAULT_BATCH_SIZE
+        n = bulk_load_csv(sys.argv[2], sys.argv[3], batch_size, threaded=True)
+        print(f"Carga masiva: {n} registros insertados en {sys.argv[3]}")
+        sys.exit()
+    if len(sys.argv) in (2, 3) and sys.argv[1] == 'stress':
+        # uso: python static_hashing.py stress [archivo.dat]
+        errors = stress_test(sys.argv[2] if len(sys.argv) == 3 else 'stress.dat')
+        for error in errors:
+            print("✗", error)
+        print("Prueba de estres:", "OK" if not errors else f"{len(errors)} errores")
+        sys.exit(1 if errors else 0)
+    if len(sys.argv) == 3 and sys.argv[1] == 'stats':
+        # uso: python static_hashing.py stats <archivo.dat>
+        with open(sys.argv[2], 'r+b') as file:
+            print(json.dumps(StaticHashing(file).stats(), indent=2))
+        sys.exit()
+
     print("=== LABORATORIO 3: Static Hashing ===")
-    print(f"BLOCK_FACTOR: {BLOCK_FACTOR}")
     print(f"N_MAIN_BUCKETS: {N_MAIN_BUCKETS}")
 
     filename = 'datahashing.dat'
@@ -208,7 +1019,8 @@ if __name__ == "__main__":
 
     print("\n1. Creando archivo de datos con hashing estático...")
     with open(filename, 'w+b') as file:
-        static_hashing = StaticHashing(file)
+        static_hashing = StaticHashing(file, page_size=DEMO_PAGE_SIZE)
+        print(f"BLOCK_FACTOR: {static_hashing.block_factor}")
 
         print("\n2. Cargando registros desde CSV...")
         records = import_csv(csv_filename)
@@ -238,6 +1050,10 @@ if __name__ == "__main__":
             else:
                 print(f"✗ No encontrado: ID {search_id}")
 
+        print("\nBúsqueda por lotes:")
+        for search_id, result in static_hashing.search_many(search_ids):
+            print(f" {'✓' if result else '✗'} ID {search_id}: {result}")
+
         print("\n7. Pruebas de eliminación:")
         print("Eliminando registros para demostrar diferentes casos...")
         # Eliminar el primer registro (debería quedar el bucket no vacío)
@@ -265,4 +1081,10 @@ if __name__ == "__main__":
         print("\n9. Contenido final después de overflow:")
         static_hashing.scanAll()
 
+        print("\n10. Compactación de las cadenas de overflow:")
+        static_hashing.compact()
+        file.seek(0, 2)
+        print(f" - Tamaño del archivo: {file.tell()} bytes, buckets libres: {static_hashing.header.n_free}")
+        static_hashing.flush()
+
         print("\n=== FIN DEL LABORATORIO ===")
@@ -0,0 +1,130 @@
+# write-ahead log con group commit
+
+# en modo WAL las inserciones y borrados no tocan el archivo de datos: se agregan al final
+# del log (escritura secuencial) y quedan en un memtable en memoria. el log se baja a disco
+# (fsync) por grupos, cada group_size operaciones o cada group_interval segundos, y el
+# memtable se aplica al archivo de datos en un checkpoint. al abrir, el log se relee para
+# recuperar las operaciones que no llegaron a aplicarse.
+# el memtable tiene semantica de upsert (la ultima operacion sobre una clave gana), asi
+# repetir un checkpoint interrumpido deja el archivo igual
+import os
+import struct
+import threading
+import time
+import zlib
+
+GROUP_COMMIT_SIZE = 64       # operaciones por fsync
+GROUP_COMMIT_INTERVAL = 0.05 # segundos maximos entre fsyncs (0 = solo por cantidad)
+CHECKPOINT_SIZE = 4096       # claves en el memtable antes de aplicar un checkpoint
+
+OP_PUT = 1
+OP_DELETE = 2
+
+MISSING = object() # la clave no esta en el memtable (hay que buscarla en el archivo)
+
+class LogEntry:
+    FORMAT = 'Bii' # op, key, largo del payload (seguido del payload y su crc32)
+    SIZE = struct.calcsize(FORMAT)
+    CRC_FORMAT = 'I'
+    CRC_SIZE = struct.calcsize(CRC_FORMAT)
+    def __init__(self, op, key, payload = b''):
+        self.op = op
+        self.key = key
+        self.payload = payload
+    def pack(self):
+        data = struct.pack(self.FORMAT, self.op, self.key, len(self.payload)) + self.payload
+        return data + struct.pack(self.CRC_FORMAT, zlib.crc32(data))
+
+class WriteAheadLog:
+    def __init__(self, filename: str, group_size: int = GROUP_COMMIT_SIZE,
+                 group_interval: float = GROUP_COMMIT_INTERVAL, checkpoint_size: int = CHECKPOINT_SIZE):
+        self.filename = filename
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.checkpoint_size = checkpoint_size
+        self.lock = threading.Lock()
+        self.memtable = {} # key -> payload (bytes) o None si la ultima operacion fue un borrado
+        self.pending = 0   # operaciones escritas pero todavia sin fsync
+        self.last_sync = time.monotonic()
+        self.recovered = self._replay()
+        self.file = open(filename, 'ab')
+        # fsync por tiempo: un hilo baja el grupo pendiente aunque no lleguen mas operaciones
+        self.stop = threading.Event()
+        self.flusher = None
+        if group_interval > 0:
+            self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flusher.start()
+    def _replay(self):
+        # carga en el memtable las operaciones del log; una entrada incompleta o con crc
+        # invalido al final (escritura cortada por una caida) se descarta junto con el resto
+        if not os.path.exists(self.filename):
+            return 0
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+        offset = 0
+        count = 0
+        while offset + LogEntry.SIZE <= len(data):
+            op, key, length = struct.unpack_from(LogEntry.FORMAT, data, offset)
+            end = offset + LogEntry.SIZE + length
+            if length < 0 or end + LogEntry.CRC_SIZE > len(data):
+                break
+            crc = struct.unpack_from(LogEntry.CRC_FORMAT, data, end)[0]
+            if crc != zlib.crc32(data[offset:end]):
+                break
+            self.memtable[key] = data[offset + LogEntry.SIZE:end] if op == OP_PUT else None
+            offset = end + LogEntry.CRC_SIZE
+            count += 1
+        if offset < len(data):
+            with open(self.filename, 'r+b') as file:
+                file.truncate(offset)
+        return count
+    def _append(self, entry):
+        with self.lock:
+            self.file.write(entry.pack())
+            self.pending += 1
+            if self.pending >= self.group_size:
+                self._sync()
+    def put(self, key: int, payload: bytes):
+        self._append(LogEntry(OP_PUT, key, payload))
+        self.memtable[key] = payload
+    def delete(self, key: int):
+        self._append(LogEntry(OP_DELETE, key))
+        self.memtable[key] = None
+    def lookup(self, key: int):
+        # payload, None (borrado) o MISSING (no hay operaciones pendientes sobre la clave)
+        return self.memtable.get(key, MISSING)
+    def needs_checkpoint(self):
+        return len(self.memtable) >= self.checkpoint_size
+    def _sync(self):
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        self.last_sync = time.monotonic()
+    def sync(self):
+        with self.lock:
+            self._sync()
+    def _flush_loop(self):
+        while not self.stop.wait(self.group_interval):
+            with self.lock:
+                if self.pending and time.monotonic() - self.last_sync >= self.group_interval:
+                    self._sync()
+    def reset(self):
+        # despues de un checkpoint: el archivo de datos ya tiene todo, el log se vacia
+        with self.lock:
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+            self.memtable = {}
+    @property
+    def closed(self):
+        return self.file.closed
+    def close(self):
+        if self.closed:
+            return
+        self.stop.set()
+        if self.flusher:
+            self.flusher.join()
+        self.sync()
+        self.file.close()